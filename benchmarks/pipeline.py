@@ -0,0 +1,99 @@
+# End-to-end scale benchmark over synthetic data:
+#   python -m benchmarks.pipeline --scales 100000,1000000,10000000 --workdir /tmp/lakehouse-bench
+# For every scale the generator output is cached under <workdir>/data_<events>_s<seed>, the full
+# pipeline runs in a fresh process against <workdir>/lake_<events> (paths are read from the
+# environment at import time), and the per-step run metrics of that run are collected.
+# Everything else in the environment is passed through, so variants can be compared with
+# --label, e.g. GOLD_BACKEND=duckdb python -m benchmarks.pipeline --label duckdb
+# Results are appended to <workdir>/bench_results.parquet.
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.synthetic_data import generate
+from src.common.paths import PROJECT_ROOT
+
+STAGES = ["bronze", "silver", "gold"]
+
+
+def _data_dir(workdir: Path, n_events: int, seed: int, days: int) -> Path:
+    data_dir = workdir / f"data_{n_events}_s{seed}_d{days}"
+    marker = data_dir / "_COMPLETE"
+    if not marker.exists():
+        t0 = time.perf_counter()
+        generate(data_dir, n_events, seed, days)
+        marker.touch()
+        print(f"generated events={n_events} in {time.perf_counter() - t0:.1f}s -> {data_dir}")
+    return data_dir
+
+
+def run_scale(workdir: Path, n_events: int, seed: int, days: int, workers: int) -> tuple[pd.DataFrame, float]:
+    data_dir = _data_dir(workdir, n_events, seed, days)
+    lake_dir = workdir / f"lake_{n_events}"
+    shutil.rmtree(lake_dir, ignore_errors=True)
+
+    env = dict(os.environ)
+    env.update({
+        "DATA_DIR": str(data_dir),
+        "LAKEHOUSE_DIR": str(lake_dir),
+        "DUCKDB_PATH": str(lake_dir / "gold.duckdb"),
+        "PIPELINE_MODE": "full",
+        "PIPELINE_WORKERS": str(workers),
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        "PYTHONPATH": str(PROJECT_ROOT),
+    })
+    t0 = time.perf_counter()
+    # cwd=workdir keeps the pipeline's logs/ out of the repo
+    subprocess.run([sys.executable, "-m", "src.main"], env=env, cwd=workdir, check=True)
+    wall_s = time.perf_counter() - t0
+
+    metrics = pd.read_parquet(lake_dir / "metrics" / "run_metrics.parquet")
+    return metrics, wall_s
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", default="100000,1000000")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--days", type=int, default=180)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--label", default="default")
+    ap.add_argument("--workdir", default="/tmp/lakehouse-bench")
+    args = ap.parse_args()
+
+    workdir = Path(args.workdir).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    scales = [int(float(s)) for s in args.scales.split(",")]
+
+    results = []
+    for n in scales:
+        metrics, wall_s = run_scale(workdir, n, args.seed, args.days, args.workers)
+        metrics["events"] = n
+        metrics["label"] = args.label
+        metrics["workers"] = args.workers
+        metrics["stage"] = metrics["step"].str.split("_").str[0]
+        results.append(metrics)
+
+        stages = metrics.groupby("stage").agg(
+            duration_s=("duration_s", "sum"), cpu_s=("cpu_s", "sum"), peak_rss_mb=("peak_rss_mb", "max"),
+        ).reindex(STAGES)
+        print(f"\nevents={n} label={args.label} workers={args.workers} wall_s={wall_s:.2f}")
+        print(stages.round(2).to_string())
+        print(metrics[["step", "duration_s", "cpu_s", "peak_rss_mb", "rows_in", "rows_out"]].to_string(index=False))
+
+    out = pd.concat(results, ignore_index=True)
+    out_path = workdir / "bench_results.parquet"
+    if out_path.exists():
+        out = pd.concat([pd.read_parquet(out_path), out], ignore_index=True)
+    out.to_parquet(out_path, index=False)
+    print(f"\nappended {sum(len(r) for r in results)} rows -> {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Row-wise apply vs vectorized signed amount / CAC division:
+#   python -m benchmarks.signed_amount --sizes 1000000,10000000,50000000
+# The row-wise baseline is only timed up to --apply-max rows (it is linear in the
+# row count); larger sizes report a linear extrapolation marked "est".
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.common.kpi_math import safe_divide, signed_amount
+
+
+def _events(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "event_type": pd.Categorical.from_codes(rng.integers(0, 2, n), ["purchase", "refund"]),
+        "amount_num": rng.normal(40, 25, n).round(2),
+    })
+
+
+def _row_wise(df: pd.DataFrame) -> pd.Series:
+    return df.apply(
+        lambda r: r["amount_num"] if r["event_type"] == "purchase" else -abs(r["amount_num"]),
+        axis=1,
+    )
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000000,10000000,50000000")
+    ap.add_argument("--apply-max", type=int, default=1_000_000)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    sizes = [int(float(s)) for s in args.sizes.split(",")]
+    apply_rate = None
+
+    print(f"{'events':>12} {'apply_s':>10} {'vectorized_s':>13} {'speedup':>9}")
+    for n in sizes:
+        df = _events(n, args.seed)
+        vec, vec_s = _timed(lambda: signed_amount(df["event_type"], df["amount_num"]))
+
+        if n <= args.apply_max:
+            ref, apply_s = _timed(lambda: _row_wise(df))
+            assert np.allclose(ref.to_numpy(dtype=float), vec.to_numpy(dtype=float))
+            apply_rate = apply_s / n
+            label = f"{apply_s:10.2f}"
+        else:
+            if apply_rate is None:
+                sample = df.head(args.apply_max)
+                _, sample_s = _timed(lambda: _row_wise(sample))
+                apply_rate = sample_s / len(sample)
+            apply_s = apply_rate * n
+            label = f"{apply_s:7.1f}est"
+
+        print(f"{n:>12} {label:>10} {vec_s:13.3f} {apply_s / vec_s:8.0f}x")
+
+    # CAC division runs on one row per channel, so only correctness matters there
+    spend = pd.Series([100.0, 50.0, 0.0])
+    conversions = pd.Series([4, 0, 0])
+    print("safe_divide:", safe_divide(spend, conversions).tolist())
+
+
+if __name__ == "__main__":
+    main()
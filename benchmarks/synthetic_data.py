@@ -0,0 +1,247 @@
+# Deterministic synthetic inputs for the pipeline:
+#   python -m benchmarks.synthetic_data --events 1000000 --seed 7 --out /tmp/bench/data
+# Writes events.ndjson, subscriptions.json and marketing_spend.csv with the same mess the
+# bronze/silver layers clean up today: duplicate event_ids, mixed timestamp formats,
+# padded / upper-case values, broken JSON lines, overlapping and re-sent subscriptions,
+# negative or unparsable spend and missing marketing days.
+# Same arguments -> byte-identical files.
+import argparse
+import csv
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.common.paths import DATA_DIR
+
+START = np.datetime64("2024-01-01T00:00:00", "s")
+CHUNK = 1_000_000
+
+EVENT_TYPES = ["page_view", "login", "purchase", "signup", "trial_start", "trial_convert", "refund"]
+EVENT_TYPE_P = [0.44, 0.24, 0.13, 0.08, 0.05, 0.03, 0.03]
+CHANNELS = ["google", "meta", "tiktok", "affiliate"]
+CURRENCIES = ["USD", "EUR", "GBP"]
+PLANS = {"basic": 9.99, "pro": 29.99, "enterprise": 99.0}
+
+
+def _pick(rng, n: int, p: float) -> np.ndarray:
+    return rng.random(n) < p
+
+
+def _timestamps(rng, secs: np.ndarray) -> list:
+    # one row in ten goes through each non-ISO path of the silver parser
+    n = len(secs)
+    ts = START + secs.astype("timedelta64[s]")
+    iso = np.datetime_as_string(ts, unit="s")
+    out = np.char.add(iso, "Z").astype(object)
+
+    kind = rng.choice(8, size=n, p=[0.45, 0.10, 0.05, 0.12, 0.10, 0.05, 0.12, 0.01])
+    m = kind == 1
+    out[m] = np.char.add(np.datetime_as_string(ts[m] + np.timedelta64(2, "h"), unit="s"), "+02:00")
+    m = kind == 2
+    out[m] = np.char.add(np.datetime_as_string(ts[m], unit="us"), "+00:00")
+    m = kind == 3
+    out[m] = np.char.replace(iso[m], "T", " ")
+    m = kind == 4
+    out[m] = (START.astype(np.int64) + secs[m]).astype(str)
+    m = kind == 5
+    out[m] = ((START.astype(np.int64) + secs[m]) * 1000 + rng.integers(0, 1000, m.sum())).astype(str)
+    m = kind == 6
+    out[m] = np.char.replace(np.char.replace(iso[m], "-", "/"), "T", " ")
+    m = kind == 7
+    out[m] = rng.choice(np.array(["not-a-date", "", None], dtype=object), m.sum())
+    return out.tolist()
+
+
+def _json_str(v) -> str:
+    return "null" if v is None else f'"{v}"'
+
+
+def write_events(path: Path, n_events: int, n_users: int, days: int, rng) -> int:
+    lines = 0
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for lo in range(0, n_events, CHUNK):
+            n = min(CHUNK, n_events - lo)
+            idx = np.arange(lo, lo + n)
+
+            # ~2% are re-sends of a recent event, sometimes with a corrected (later) timestamp
+            src = idx.copy()
+            dup = _pick(rng, n, 0.02) & (idx > 0)
+            src[dup] = np.maximum(idx[dup] - rng.integers(1, 5000, dup.sum()), 0)
+            secs = rng.integers(0, days * 86400, n)
+            secs[dup] = np.minimum(secs[dup] + rng.integers(0, 3600, dup.sum()), days * 86400 - 1)
+            event_ids = [f"evt_{i:012d}" for i in src.tolist()]
+
+            users = np.char.add("u", rng.integers(0, n_users, n).astype(str)).astype(object)
+            m = _pick(rng, n, 0.01)
+            users[m] = np.char.add(np.char.add(" ", users[m].astype(str)), " ")
+            users[_pick(rng, n, 0.005)] = None
+            users[_pick(rng, n, 0.005)] = ""
+
+            types = rng.choice(len(EVENT_TYPES), size=n, p=EVENT_TYPE_P)
+            type_names = np.array(EVENT_TYPES, dtype=object)[types]
+            m = _pick(rng, n, 0.03)
+            type_names[m] = np.char.upper(type_names[m].astype(str))
+            m = _pick(rng, n, 0.02)
+            type_names[m] = np.char.add(type_names[m].astype(str), " ")
+
+            timestamps = _timestamps(rng, secs)
+            versions = np.where(_pick(rng, n, 0.2), "2", "1")
+
+            # optional fields rendered once per row, only where the event type carries them
+            extra = np.full(n, "", dtype=object)
+            money = np.flatnonzero((types == EVENT_TYPES.index("purchase")) | (types == EVENT_TYPES.index("refund")))
+            amounts = rng.gamma(2.0, 20.0, len(money)).round(2)
+            currencies = rng.choice(CURRENCIES, len(money))
+            shape = rng.random(len(money))
+            for k, i in enumerate(money.tolist()):
+                amount = amounts[k]
+                if types[i] == EVENT_TYPES.index("refund") and shape[k] < 0.5:
+                    amount = -amount
+                if shape[k] < 0.02:
+                    amount_json = "null"
+                elif shape[k] > 0.9:
+                    amount_json = f'"{amount}"'
+                else:
+                    amount_json = repr(float(amount))
+                extra[i] = f', "amount": {amount_json}, "currency": "{currencies[k]}"'
+                if versions[i] == "2":
+                    extra[i] += f', "tax": {round(float(amount) * 0.2, 2)}'
+                if types[i] == EVENT_TYPES.index("refund"):
+                    extra[i] += f', "refers_to_event_id": "evt_{max(idx[i] - 1000, 0):012d}"'
+            signups = np.flatnonzero(types == EVENT_TYPES.index("signup"))
+            channels = rng.choice(CHANNELS + [""], len(signups), p=[0.35, 0.3, 0.2, 0.1, 0.05])
+            for k, i in enumerate(signups.tolist()):
+                extra[i] = f', "acquisition_channel": "{channels[k]}"'
+
+            broken = _pick(rng, n, 0.001)
+            blank = _pick(rng, n, 0.0005)
+            out = []
+            for i in range(n):
+                line = (
+                    f'{{"event_id": "{event_ids[i]}", "user_id": {_json_str(users[i])}, '
+                    f'"event_type": "{type_names[i]}", "timestamp": {_json_str(timestamps[i])}, '
+                    f'"schema_version": "{versions[i]}"{extra[i]}}}'
+                )
+                if broken[i]:
+                    line = line[: len(line) // 2]
+                out.append(line)
+                if blank[i]:
+                    out.append("")
+            f.write("\n".join(out))
+            f.write("\n")
+            lines += len(out)
+    return lines
+
+
+def write_subscriptions(path: Path, n_subs: int, n_users: int, days: int, rng) -> int:
+    plan_names = list(PLANS)
+    users = rng.integers(0, n_users, n_subs)
+    starts = rng.integers(0, days, n_subs)
+    lengths = rng.integers(30, 366, n_subs)
+    open_ended = _pick(rng, n_subs, 0.4)
+    plans = rng.choice(len(plan_names), n_subs, p=[0.5, 0.4, 0.1])
+    currencies = rng.choice(CURRENCIES, n_subs)
+    shape = rng.random(n_subs)
+
+    # ~8% start while the same user's previous subscription is still running
+    overlap = _pick(rng, n_subs, 0.08)
+    overlap[0] = False
+    users[overlap] = users[np.flatnonzero(overlap) - 1]
+    starts[overlap] = starts[np.flatnonzero(overlap) - 1] + rng.integers(0, 30, overlap.sum())
+
+    # ~3% re-sent later under the same subscription_id, with a new price or status
+    resent = np.flatnonzero(_pick(rng, n_subs, 0.03))
+
+    rows = []
+    for i in range(n_subs):
+        start = START + np.timedelta64(int(starts[i]), "D")
+        end = None if open_ended[i] else str((start + np.timedelta64(int(lengths[i]), "D")).astype("datetime64[D]"))
+        plan = plan_names[plans[i]]
+        price = PLANS[plan]
+        rows.append({
+            "subscription_id": f"sub_{i:09d}",
+            "user_id": f"u{users[i]}" if shape[i] > 0.01 else "",
+            "plan_id": plan if shape[i] < 0.97 else f" {plan} ",
+            "price": str(price) if shape[i] > 0.95 else (None if 0.50 < shape[i] < 0.51 else price),
+            "currency": str(currencies[i]),
+            "start_date": str(start.astype("datetime64[D]")) if not 0.60 < shape[i] < 0.61 else None,
+            "end_date": end,
+            "status": "active" if end is None else ("cancelled" if shape[i] < 0.9 else " CANCELLED"),
+            "created_at": f"{np.datetime_as_string(start + np.timedelta64(int(shape[i] * 36000), 's'), unit='s')}Z",
+        })
+    for i in resent.tolist():
+        row = dict(rows[i])
+        created = np.datetime64(row["created_at"].rstrip("Z")) + np.timedelta64(86400, "s")
+        row["created_at"] = f"{np.datetime_as_string(created, unit='s')}Z"
+        row["status"] = "cancelled"
+        rows.append(row)
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        f.write(",\n".join(json.dumps(r) for r in rows))
+        f.write("\n]\n")
+    return len(rows)
+
+
+def write_marketing(path: Path, days: int, rng) -> int:
+    n = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["date", "channel", "spend"])
+        for d in range(days):
+            day = str((START + np.timedelta64(d, "D")).astype("datetime64[D]"))
+            for channel in CHANNELS:
+                r = rng.random()
+                if r < 0.05:
+                    # missing day, silver fills it with 0
+                    continue
+                spend = round(float(rng.gamma(3.0, 150.0)), 2)
+                if r < 0.06:
+                    spend = -spend
+                value = "n/a" if 0.06 <= r < 0.065 else spend
+                name = f" {channel}" if 0.065 <= r < 0.08 else channel
+                if 0.08 <= r < 0.09:
+                    # the same day/channel reported in two rows
+                    w.writerow([day, name, round(spend / 2, 2)])
+                    value = round(spend - round(spend / 2, 2), 2)
+                    n += 1
+                w.writerow([day, name, value])
+                n += 1
+    return n
+
+
+def generate(out_dir: Path, n_events: int, seed: int = 7, days: int = 180,
+             n_users: int | None = None, n_subscriptions: int | None = None) -> dict:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    n_users = n_users or max(1000, n_events // 20)
+    n_subscriptions = n_subscriptions or max(100, n_events // 50)
+
+    # one generator per file, so changing one file's parameters leaves the others unchanged
+    ss = np.random.SeedSequence(seed)
+    ev_rng, sub_rng, mkt_rng = (np.random.default_rng(s) for s in ss.spawn(3))
+    return {
+        "events_lines": write_events(out_dir / "events.ndjson", n_events, n_users, days, ev_rng),
+        "subscriptions": write_subscriptions(out_dir / "subscriptions.json", n_subscriptions, n_users, days, sub_rng),
+        "marketing_rows": write_marketing(out_dir / "marketing_spend.csv", days, mkt_rng),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=100_000)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--days", type=int, default=180)
+    ap.add_argument("--users", type=int, default=None)
+    ap.add_argument("--subscriptions", type=int, default=None)
+    ap.add_argument("--out", default=str(DATA_DIR))
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    counts = generate(Path(args.out), args.events, args.seed, args.days, args.users, args.subscriptions)
+    print(f"wrote {args.out} in {time.perf_counter() - t0:.1f}s " + " ".join(f"{k}={v}" for k, v in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
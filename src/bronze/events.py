@@ -1,51 +1,427 @@
 import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from src.common import bronze_format, inputs, watermarks
+from src.common.datasets import files_dataset
 from src.common.logger import get_logger
 logger = get_logger("bronze_events")
 
-from src.common.paths import EVENTS_NDJSON, BRONZE_DIR, QUARANTINE_DIR
+from src.common.paths import EVENTS_INPUT, BRONZE_DIR, QUARANTINE_DIR
 
+# streaming mode keeps peak memory bounded by one batch of lines instead of the whole file
+STREAMING = os.getenv("BRONZE_EVENTS_STREAMING", "0") == "1"
+BATCH_SIZE = int(os.getenv("BRONZE_EVENTS_BATCH_SIZE", "200000"))
 
-def main():
-    
+# sharded inputs (a glob or compressed files) are parsed one file per process
+WORKERS = int(os.getenv("BRONZE_EVENTS_WORKERS", "1"))
+PARTS_DIR = BRONZE_DIR / "_parts_events"
+
+BAD_ROWS_SCHEMA = pa.schema([
+    ("_source_line_no", pa.int64()),
+    ("_source_file", pa.string()),
+    ("_raw_line", pa.string()),
+    ("_error", pa.string()),
+])
+
+
+def _parse_line(line_no: int, line: str, source_file: str):
+    line = line.strip()
+    if line == "":
+        return None, None
+
+    try:
+        event = json.loads(line)
+        event["_source_line_no"] = line_no
+        event["_source_file"] = source_file
+        return event, None
+    except Exception as e:
+        return None, {
+            "_source_line_no": line_no,
+            "_source_file": source_file,
+            "_raw_line": line[:3000],
+            "_error": str(e)
+        }
+
+
+def _text_lines(path):
+    with inputs.open_text(path) as f:
+        yield from enumerate(f, start=1)
+
+
+def _scan_tail(path, start_offset: int) -> tuple[int, int]:
+    # end offset and line count of the complete lines after start_offset;
+    # a trailing line without newline may still be in flight and is left for the next run
+    end_offset = start_offset
+    n_lines = 0
+    with open(path, "rb") as f:
+        f.seek(start_offset)
+        pos = start_offset
+        while True:
+            chunk = f.read(16 * 1024 * 1024)
+            if not chunk:
+                break
+            last_nl = chunk.rfind(b"\n")
+            if last_nl >= 0:
+                n_lines += chunk.count(b"\n")
+                end_offset = pos + last_nl + 1
+            pos += len(chunk)
+    return end_offset, n_lines
+
+
+def _tail_lines(path, start_offset: int, start_line_no: int, end_offset: int):
+    # binary mode so lines can be read from a byte-offset watermark
+    with open(path, "rb") as f:
+        f.seek(start_offset)
+        pos = start_offset
+        line_no = start_line_no
+        for raw in f:
+            if pos >= end_offset:
+                break
+            pos += len(raw)
+            line_no += 1
+            yield line_no, raw.decode("utf-8")
+
+
+def _file_lines(path, progress: dict):
+    # a full read of the single file, in binary like _tail_lines: the complete lines are counted as they
+    # pass, so the watermark needs no second scan; a trailing line without newline is read again next run
+    with open(path, "rb") as f:
+        for line_no, raw in enumerate(f, start=1):
+            if raw.endswith(b"\n"):
+                progress["byte_offset"] += len(raw)
+                progress["line_no"] = line_no
+            yield line_no, raw.decode("utf-8")
+
+
+def _iter_batches(lines, batch_size: int, source_file: str):
+    good_rows = []
+    bad_rows = []
+    for line_no, line in lines:
+        event, bad = _parse_line(line_no, line, source_file)
+        if event is not None:
+            good_rows.append(event)
+        elif bad is not None:
+            bad_rows.append(bad)
+
+        if len(good_rows) + len(bad_rows) >= batch_size:
+            yield good_rows, bad_rows
+            good_rows = []
+            bad_rows = []
+
+    if good_rows or bad_rows:
+        yield good_rows, bad_rows
+
+
+def _good_schema(columns: list[str], typed: bool) -> pa.Schema:
+    return bronze_format.typed_schema(columns) if typed else pa.schema([(c, pa.string()) for c in columns])
+
+
+def _good_table(good_rows: list[dict], schema: pa.Schema, typed: bool) -> pa.Table:
+    if typed:
+        return bronze_format.records_to_table(good_rows, schema.names)
+    # same per-row semantics as the in-memory path: a missing key becomes what astype(str) makes of NaN
+    good_df = pd.DataFrame(good_rows, dtype=object).reindex(columns=schema.names).astype(str)
+    return pa.Table.from_pandas(good_df, schema=schema, preserve_index=False)
+
+
+def _unify_parts(parts: list[Path], schema: pa.Schema, out_path: Path, typed: bool):
+    # each part was written with the columns seen up to its first batch; the file gets all of them,
+    # with the columns a part has not seen yet filled the way a missing key is in that part's rows
+    if len(parts) == 1:
+        os.replace(parts[0], out_path)
+        return
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for part in parts:
+            for batch in pq.ParquetFile(part).iter_batches():
+                missing = [f for f in schema if f.name not in batch.schema.names]
+                if typed:
+                    fill = pa.table({f.name: pa.nulls(batch.num_rows, f.type) for f in missing})
+                else:
+                    fill_df = pd.DataFrame(index=pd.RangeIndex(batch.num_rows), columns=[f.name for f in missing])
+                    fill = pa.Table.from_pandas(fill_df.astype(str), schema=pa.schema(missing), preserve_index=False)
+                table = pa.Table.from_batches([batch])
+                writer.write_table(pa.Table.from_arrays(
+                    [table.column(f.name) if f.name in table.column_names else fill.column(f.name) for f in schema],
+                    schema=schema,
+                ))
+            part.unlink()
+
+
+def _write_streaming(lines_fn, good_path, bad_path, batch_size: int, source_file: str) -> tuple[int, int, int]:
+    # one parse per line: columns are collected as batches arrive, in the order pd.DataFrame(list_of_dicts)
+    # would produce, and a batch with new keys starts a new part file that is re-cast at the end
+    typed = bronze_format.is_typed()
+    columns = {}
+    parts = []
+    good_writer = None
+
+    good_count = 0
+    bad_count = 0
+    batches = 0
+
+    try:
+        with pq.ParquetWriter(bad_path, BAD_ROWS_SCHEMA) as bad_writer:
+            for good_rows, bad_rows in _iter_batches(lines_fn(), batch_size, source_file):
+                if good_rows:
+                    for event in good_rows:
+                        for k in event:
+                            columns.setdefault(k, None)
+                    if good_writer is None or len(columns) > len(good_writer.schema):
+                        if good_writer is not None:
+                            good_writer.close()
+                        parts.append(good_path.with_name(f"{good_path.name}.part{len(parts)}"))
+                        good_writer = pq.ParquetWriter(parts[-1], _good_schema(list(columns), typed))
+                    good_writer.write_table(_good_table(good_rows, good_writer.schema, typed))
+                    good_count += len(good_rows)
+
+                if bad_rows:
+                    bad_df = pd.DataFrame(bad_rows)
+                    bad_writer.write_table(pa.Table.from_pandas(bad_df, schema=BAD_ROWS_SCHEMA, preserve_index=False))
+                    bad_count += len(bad_df)
+
+                batches += 1
+    finally:
+        if good_writer is not None:
+            good_writer.close()
+
+    schema = _good_schema(list(columns), typed)
+    if parts:
+        _unify_parts(parts, schema, good_path, typed)
+    else:
+        pq.write_table(schema.empty_table(), good_path)
+    logger.info(f"Bronze events streaming: columns={len(columns)} batch_size={batch_size} parts={len(parts)}")
+
+    return good_count, bad_count, batches
+
+
+def _events_file() -> Path | None:
+    # single-file mode: EVENTS_INPUT names one uncompressed file, which can be tailed by byte offset
+    files = inputs.expand(EVENTS_INPUT)
+    if inputs.is_pattern(EVENTS_INPUT) or inputs.is_compressed(files[0]):
+        return None
+    return files[0]
+
+
+def _ingest_file(path: Path, good_path: Path, bad_path: Path, batch_size: int) -> tuple[int, int, int]:
+    # one shard in a worker process; line numbers restart at 1 and are shifted when combining
+    n_lines = 0
+
+    def lines():
+        nonlocal n_lines
+        for line_no, line in _text_lines(path):
+            n_lines = line_no
+            yield line_no, line
+
+    good_count, bad_count, _ = _write_streaming(lines, good_path, bad_path, batch_size, inputs.source_name(path))
+    return good_count, bad_count, n_lines
+
+
+def _shift_line_no(table: pa.Table, offset: int) -> pa.Table:
+    i = table.schema.get_field_index("_source_line_no")
+    if i < 0 or offset == 0:
+        return table
+    col = table.column(i)
+    shifted = pc.add(pc.cast(col, pa.int64()), offset)
+    return table.set_column(i, table.schema.field(i), pc.cast(shifted, col.type))
+
+
+def _combine(parts: list[Path], offsets: list[int], out_path: Path):
+    # one bronze file again, with _source_line_no counting lines across the ordered shards,
+    # so silver's last-write-wins still sees a later shard as a later arrival
+    dataset = files_dataset(parts)
+    tmp = out_path.with_name(f"{out_path.name}.tmp")
+    with pq.ParquetWriter(tmp, dataset.schema) as writer:
+        for part, offset in zip(parts, offsets):
+            for batch in ds.dataset(str(part), schema=dataset.schema, format="parquet").to_batches():
+                writer.write_table(_shift_line_no(pa.Table.from_batches([batch], dataset.schema), offset))
+    os.replace(tmp, out_path)
+
+
+def _ingest_files(files: list[Path], good_path: Path, bad_path: Path, first_line_no: int,
+                  batch_size: int = BATCH_SIZE) -> tuple[int, int, int]:
+    shutil.rmtree(PARTS_DIR, ignore_errors=True)
+    PARTS_DIR.mkdir(parents=True, exist_ok=True)
+    good_parts = [PARTS_DIR / f"good-{i:05d}.parquet" for i in range(len(files))]
+    bad_parts = [PARTS_DIR / f"bad-{i:05d}.parquet" for i in range(len(files))]
+    sizes = [batch_size] * len(files)
+
+    if WORKERS > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+            counts = list(pool.map(_ingest_file, files, good_parts, bad_parts, sizes))
+    else:
+        counts = [_ingest_file(*args) for args in zip(files, good_parts, bad_parts, sizes)]
+
+    offsets = []
+    n_lines = first_line_no
+    for _, _, lines in counts:
+        offsets.append(n_lines)
+        n_lines += lines
+
+    if files:
+        _combine(good_parts, offsets, good_path)
+        _combine(bad_parts, offsets, bad_path)
+    else:
+        pq.write_table(pa.table({}), good_path)
+        pq.write_table(BAD_ROWS_SCHEMA.empty_table(), bad_path)
+    shutil.rmtree(PARTS_DIR, ignore_errors=True)
+
+    good_count = sum(c[0] for c in counts)
+    bad_count = sum(c[1] for c in counts)
+    logger.info(f"Bronze events shards ingested: files={len(files)} workers={min(WORKERS, max(len(files), 1))}")
+    return good_count, bad_count, n_lines - first_line_no
+
+
+def main_sharded(batch_size: int = BATCH_SIZE):
     BRONZE_DIR.mkdir(parents=True, exist_ok=True)
     QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
 
-    good_rows = []  
-    bad_rows = []    
-
-    
-    with open(EVENTS_NDJSON, "r", encoding="utf-8") as f:
-        for line_no, line in enumerate(f, start=1):
-            line = line.strip()
-            if line == "":
-                continue
-
-            try:
-                event = json.loads(line)  
-                event["_source_line_no"] = line_no
-                good_rows.append(event)
-
-            except Exception as e:
-                bad_rows.append({
-                    "_source_line_no": line_no,
-                    "_raw_line": line[:3000],
-                    "_error": str(e)
-                })
-
-    good_df = pd.DataFrame(good_rows)
-    bad_df = pd.DataFrame(bad_rows)
+    files = inputs.expand(EVENTS_INPUT)
+    if not files:
+        raise FileNotFoundError(f"No event files match {EVENTS_INPUT}")
+
+    good_count, bad_count, n_lines = _ingest_files(
+        files, BRONZE_DIR / "events_raw.parquet", QUARANTINE_DIR / "events_bad_rows.parquet", 0, batch_size,
+    )
+    # same watermark main_incremental_sharded keeps: the next incremental run skips these shards
+    watermarks.set_pending("events", {"files": sorted(inputs.source_name(f) for f in files), "line_no": n_lines})
+
+    logger.info(f"Bronze events saved: {good_count}")
+    logger.info(f"Bad rows saved: {bad_count}")
+
+
+def main_streaming(batch_size: int = BATCH_SIZE):
+    BRONZE_DIR.mkdir(parents=True, exist_ok=True)
+    QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
+
+    path = _events_file()
+    progress = {"byte_offset": 0, "line_no": 0}
+    good_count, bad_count, batches = _write_streaming(
+        lambda: _file_lines(path, progress),
+        BRONZE_DIR / "events_raw.parquet",
+        QUARANTINE_DIR / "events_bad_rows.parquet",
+        batch_size,
+        inputs.source_name(path),
+    )
+    # the watermark main_incremental keeps: the next incremental run starts after what was read here
+    watermarks.set_pending("events", progress)
+
+    logger.info(f"Bronze events saved: {good_count} batches={batches}")
+    logger.info(f"Bad rows saved: {bad_count}")
+
+
+def main_incremental_sharded(batch_size: int = BATCH_SIZE):
+    # shards are immutable once dropped: a run ingests the files it has not seen yet
+    BRONZE_DIR.mkdir(parents=True, exist_ok=True)
+    QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
+
+    wm = watermarks.get_watermark("events") or {}
+    seen = set(wm.get("files", []))
+    line_no = wm.get("line_no", 0)
+    files = [f for f in inputs.expand(EVENTS_INPUT) if inputs.source_name(f) not in seen]
+    logger.info(f"Bronze events incremental: new_files={len(files)} seen_files={len(seen)}")
+
+    good_count, bad_count, n_lines = _ingest_files(
+        files, BRONZE_DIR / "events_raw_delta.parquet", QUARANTINE_DIR / "events_bad_rows_delta.parquet",
+        line_no, batch_size,
+    )
 
+    watermarks.set_pending("events", {
+        "files": sorted(seen | {inputs.source_name(f) for f in files}),
+        "line_no": line_no + n_lines,
+    })
 
-    good_df = good_df.astype(str)
+    logger.info(f"Bronze events delta saved: {good_count}")
+    logger.info(f"Bad rows saved: {bad_count}")
+
+
+def main_incremental(batch_size: int = BATCH_SIZE):
+    path = _events_file()
+    if path is None:
+        main_incremental_sharded(batch_size)
+        return
+
+    BRONZE_DIR.mkdir(parents=True, exist_ok=True)
+    QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
+
+    wm = watermarks.get_watermark("events") or {"byte_offset": 0, "line_no": 0}
+    if "byte_offset" not in wm:
+        logger.warning("Events watermark is from sharded input, re-reading the file from the start")
+        wm = {"byte_offset": 0, "line_no": wm.get("line_no", 0)}
+    if path.stat().st_size < wm["byte_offset"]:
+        logger.warning(f"Events file shrank below watermark={wm}, re-reading from the start")
+        wm = {"byte_offset": 0, "line_no": 0}
+
+    end_offset, n_lines = _scan_tail(path, wm["byte_offset"])
+    logger.info(f"Bronze events incremental: from_offset={wm['byte_offset']} to_offset={end_offset} lines={n_lines}")
+
+    good_count, bad_count, batches = _write_streaming(
+        lambda: _tail_lines(path, wm["byte_offset"], wm["line_no"], end_offset),
+        BRONZE_DIR / "events_raw_delta.parquet",
+        QUARANTINE_DIR / "events_bad_rows_delta.parquet",
+        batch_size,
+        inputs.source_name(path),
+    )
+
+    watermarks.set_pending("events", {"byte_offset": end_offset, "line_no": wm["line_no"] + n_lines})
+
+    logger.info(f"Bronze events delta saved: {good_count} batches={batches}")
+    logger.info(f"Bad rows saved: {bad_count}")
+
+
+def main(streaming: bool = STREAMING, incremental: bool = False):
+    if incremental:
+        main_incremental()
+        return
+
+    path = _events_file()
+    if path is None:
+        main_sharded()
+        return
+
+    if streaming:
+        main_streaming()
+        return
+
+    BRONZE_DIR.mkdir(parents=True, exist_ok=True)
+    QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
+
+    good_rows = []
+    bad_rows = []
+
+    source_file = inputs.source_name(path)
+    progress = {"byte_offset": 0, "line_no": 0}
+    for line_no, line in _file_lines(path, progress):
+        event, bad = _parse_line(line_no, line, source_file)
+        if event is not None:
+            good_rows.append(event)
+        elif bad is not None:
+            bad_rows.append(bad)
+
+    bad_df = pd.DataFrame(bad_rows)
 
+    if bronze_format.is_typed():
+        columns = list(dict.fromkeys(k for event in good_rows for k in event))
+        pq.write_table(bronze_format.records_to_table(good_rows, columns), BRONZE_DIR / "events_raw.parquet")
+    else:
+        # object columns: each value is stringified as parsed, so an int stays "10" even when other
+        # rows of its column are null (a float64 column would make it "10.0"), whatever the batch size
+        good_df = pd.DataFrame(good_rows, dtype=object)
+        good_df = good_df.astype(str)
+        good_df.to_parquet(BRONZE_DIR / "events_raw.parquet", index=False)
 
-    good_df.to_parquet(BRONZE_DIR / "events_raw.parquet", index=False)
     bad_df.to_parquet(QUARANTINE_DIR / "events_bad_rows.parquet", index=False)
+    watermarks.set_pending("events", progress)
 
-    logger.info(f"Bronze events saved: {len(good_df)}")
+    logger.info(f"Bronze events saved: {len(good_rows)}")
     logger.info(f"Bad rows saved: {len(bad_df)}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,22 +1,43 @@
 import pandas as pd
+import pyarrow.parquet as pq
+from src.common import bronze_format, inputs, watermarks
 from src.common.logger import get_logger
 logger = get_logger("bronze_marketing")
 
-from src.common.paths import MARKETING_CSV, BRONZE_DIR
+from src.common.paths import MARKETING_INPUT, BRONZE_DIR
 
 
-def main():
+def main(incremental: bool = False):
     BRONZE_DIR.mkdir(parents=True, exist_ok=True)
 
-    df = pd.read_csv(MARKETING_CSV)
-
-    # Bronze: needs raw data but convert to str to avoide parquet issues
-    df = df.astype(str)
-
-    out_path = BRONZE_DIR / "marketing_spend_raw.parquet"
-    df.to_parquet(out_path, index=False)
-
-    logger.info(f"Bronze marketing saved: {len(df)}")
+    # typed bronze keeps the CSV text as written ("10.50" stays "10.50"), empty cells as nulls
+    frames = []
+    for path in inputs.expand(MARKETING_INPUT):
+        with inputs.open_text(path) as f:
+            frames.append(pd.read_csv(f, dtype=str) if bronze_format.is_typed() else pd.read_csv(f))
+    df = pd.concat(frames, ignore_index=True)
+
+    wm = watermarks.get_watermark("marketing") if incremental else None
+    dates = pd.to_datetime(df["date"], errors="coerce")
+    if wm is not None:
+        # the watermark day is re-read in full so rows arriving late for it are not lost
+        df = df[dates >= pd.Timestamp(wm["max_date"])]
+        dates = dates[df.index]
+
+    # full runs record it as well, so the next incremental run starts after the rebuilt days
+    max_date = dates.max()
+    watermarks.set_pending("marketing", {"max_date": str(max_date.date())} if pd.notna(max_date) else wm)
+
+    out_path = BRONZE_DIR / ("marketing_spend_raw_delta.parquet" if incremental else "marketing_spend_raw.parquet")
+
+    if bronze_format.is_typed():
+        pq.write_table(bronze_format.frame_to_table(df), out_path)
+    else:
+        # Bronze: needs raw data but convert to str to avoide parquet issues
+        df = df.astype(str)
+        df.to_parquet(out_path, index=False)
+
+    logger.info(f"Bronze marketing saved: {len(df)} path={out_path}")
 
 
 if __name__ == "__main__":
@@ -1,25 +1,50 @@
 import json
 import pandas as pd
+import pyarrow.parquet as pq
+from src.common import bronze_format, inputs, watermarks
 from src.common.logger import get_logger
 logger = get_logger("bronze_subscriptions")
 
-from src.common.paths import SUBSCRIPTIONS_JSON, BRONZE_DIR
+from src.common.paths import SUBSCRIPTIONS_INPUT, BRONZE_DIR
 
 
-def main():
+def main(incremental: bool = False):
     BRONZE_DIR.mkdir(parents=True, exist_ok=True)
 
-    # subscriptions.json is a JSON array
-    with open(SUBSCRIPTIONS_JSON, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    # every subscriptions file is a JSON array; shards are concatenated in name order
+    data = []
+    for path in inputs.expand(SUBSCRIPTIONS_INPUT):
+        with inputs.open_text(path) as f:
+            data.extend(json.load(f))
 
     df = pd.DataFrame(data)
 
-    # Bronze: keep raw convert to string to avoid parquet issues
-    df = df.astype(str)
+    created = pd.to_datetime(df.get("created_at", pd.Series(dtype=object)), errors="coerce", utc=True, format="mixed")
+    max_created = created.max()
+    if incremental:
+        # silver needs every version of a subscription to resolve overlaps, so a change
+        # past the watermark re-lands the whole (small) file instead of a delta
+        wm = watermarks.get_watermark("subscriptions")
+        if wm is not None and wm["max_created_at"] is not None and (
+            pd.isna(max_created) or max_created <= pd.Timestamp(wm["max_created_at"])
+        ):
+            logger.info(f"Bronze subscriptions unchanged since watermark={wm['max_created_at']}")
+            return
+    # full runs record it as well, so the next incremental run skips an unchanged file
+    watermarks.set_pending(
+        "subscriptions",
+        {"max_created_at": max_created.isoformat() if pd.notna(max_created) else None},
+    )
 
     out_path = BRONZE_DIR / "subscriptions_raw.parquet"
-    df.to_parquet(out_path, index=False)
+
+    if bronze_format.is_typed():
+        # from the parsed JSON records, so a missing price never widens 29 into "29.0"
+        pq.write_table(bronze_format.records_to_table(data, list(df.columns)), out_path)
+    else:
+        # Bronze: keep raw convert to string to avoid parquet issues
+        df = df.astype(str)
+        df.to_parquet(out_path, index=False)
 
     logger.info(f"Bronze subscriptions saved: {len(df)}")
 
@@ -0,0 +1,63 @@
+import json
+import math
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+# "string": every column cast with astype(str); a missing value stays null (pandas 2 wrote "nan"/"None",
+# which silver reads as missing too).
+# "typed": values kept as the raw text received, real nulls, low-cardinality columns dictionary-encoded.
+BRONZE_FORMAT = os.getenv("BRONZE_FORMAT", "string")
+
+DICTIONARY_COLUMNS = {
+    "event_type", "currency", "channel", "plan_id", "status", "acquisition_channel", "schema_version",
+    "_source_file",
+}
+INT_COLUMNS = {"_source_line_no"}
+
+
+def is_typed() -> bool:
+    return BRONZE_FORMAT == "typed"
+
+
+def typed_schema(columns: list[str]) -> pa.Schema:
+    fields = []
+    for c in columns:
+        if c in INT_COLUMNS:
+            fields.append(pa.field(c, pa.int64()))
+        elif c in DICTIONARY_COLUMNS:
+            fields.append(pa.field(c, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(c, pa.string()))
+    return pa.schema(fields)
+
+
+def _raw_text(v):
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return None
+    if isinstance(v, str):
+        return v
+    if isinstance(v, (dict, list)):
+        return json.dumps(v)
+    return str(v)
+
+
+def records_to_table(records: list[dict], columns: list[str]) -> pa.Table:
+    # built column by column from the parsed records, so pandas never infers (and widens) a dtype
+    schema = typed_schema(columns)
+    arrays = []
+    for field in schema:
+        values = [r.get(field.name) for r in records]
+        if pa.types.is_integer(field.type):
+            arrays.append(pa.array(values, type=field.type))
+            continue
+        arr = pa.array([_raw_text(v) for v in values], type=pa.string())
+        if pa.types.is_dictionary(field.type):
+            arr = arr.dictionary_encode()
+        arrays.append(arr)
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def frame_to_table(df: pd.DataFrame) -> pa.Table:
+    return records_to_table(df.to_dict("records"), list(df.columns))
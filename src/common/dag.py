@@ -0,0 +1,91 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable
+
+from src.common import db
+from src.common.logger import get_logger, get_run_context, set_run_context
+
+logger = get_logger("dag")
+
+
+@dataclass(frozen=True)
+class Step:
+    name: str
+    fn: Callable[[], None]
+    inputs: tuple[str, ...] = ()
+    outputs: tuple[str, ...] = ()
+
+
+def build_deps(steps: list[Step]) -> dict[str, set[str]]:
+    # a step waits for every earlier step that writes what it reads, writes what it writes
+    # (e.g. the same DuckDB file) or reads what it is about to overwrite
+    deps = {s.name: set() for s in steps}
+    for i, step in enumerate(steps):
+        ins, outs = set(step.inputs), set(step.outputs)
+        for prev in steps[:i]:
+            prev_ins, prev_outs = set(prev.inputs), set(prev.outputs)
+            if ins & prev_outs or outs & prev_outs or outs & prev_ins:
+                deps[step.name].add(prev.name)
+    return deps
+
+
+def _run_in_worker(run_step, step: Step, run_info: dict):
+    set_run_context(run_info)
+    try:
+        return run_step(step.name, step.fn, step.inputs, step.outputs)
+    finally:
+        # workers outlive their steps; the next DuckDB step may run in another process
+        db.close()
+
+
+def _collect(results: list | None, value):
+    # run_step returns its step metrics; a failed step attaches them to the exception
+    if results is not None and value is not None:
+        results.append(value)
+
+
+def run_dag(steps: list[Step], run_step, workers: int = 1, results: list | None = None):
+    if workers <= 1:
+        # declaration order is already a valid topological order
+        for step in steps:
+            try:
+                _collect(results, run_step(step.name, step.fn, step.inputs, step.outputs))
+            except Exception as e:
+                _collect(results, getattr(e, "step_metrics", None))
+                raise
+        return
+
+    deps = build_deps(steps)
+    pending = {s.name: s for s in steps}
+    done = set()
+    running = {}
+    error = None
+    run_info = get_run_context()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            if error is None:
+                for name, step in list(pending.items()):
+                    if deps[name] <= done:
+                        running[pool.submit(_run_in_worker, run_step, step, run_info)] = name
+                        del pending[name]
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                try:
+                    _collect(results, fut.result())
+                    done.add(name)
+                except Exception as e:
+                    _collect(results, getattr(e, "step_metrics", None))
+                    # same as the sequential run: nothing new starts after the first failure
+                    if error is None:
+                        error = e
+
+    if error is not None:
+        for name in pending:
+            logger.info(f"SKIPPED step={name}")
+        raise error
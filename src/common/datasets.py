@@ -0,0 +1,149 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.common.paths import SILVER_DIR, SILVER_EVENTS_DIR, SILVER_MARKETING_DIR, SILVER_USER_DAILY_DIR
+
+PART_FILE = "part-0.parquet"
+
+# bounded row groups so min/max statistics on the sort columns can skip most of a file
+ROW_GROUP_ROWS = int(os.getenv("SILVER_ROW_GROUP_ROWS", "131072"))
+
+
+def partition_dir(root, key: str, value: str):
+    return root / f"{key}={value}"
+
+
+def list_partitions(root, key: str) -> list[str]:
+    if not root.exists():
+        return []
+    prefix = f"{key}="
+    return sorted(p.name[len(prefix):] for p in root.iterdir() if p.is_dir() and p.name.startswith(prefix))
+
+
+def partition_files(root, key: str, value: str) -> list:
+    # a partition is every Parquet file in its directory (e.g. one per dedup spill partition)
+    part = partition_dir(root, key, value)
+    if not part.exists():
+        return []
+    return sorted(part.glob("*.parquet"))
+
+
+def partitioned_files(root, key: str, values: list[str] | None = None) -> list:
+    if values is None:
+        values = list_partitions(root, key)
+    return [f for v in values for f in partition_files(root, key, v)]
+
+
+def read_partition(root, key: str, value: str, columns: list[str] | None = None, filters=None):
+    files = partition_files(root, key, value)
+    if not files:
+        return None
+    return read(files, columns, filters)
+
+
+def _write_parquet(df: pd.DataFrame, path, sort_by: list[str] | None = None):
+    if sort_by:
+        df = df.sort_values(sort_by, kind="stable")
+    tmp = path.with_name(f"{path.name}.tmp")
+    df.to_parquet(tmp, index=False, row_group_size=ROW_GROUP_ROWS)
+    os.replace(tmp, path)
+
+
+def write_partition(df: pd.DataFrame, root, key: str, value: str, sort_by: list[str] | None = None):
+    # replaces the whole partition with a single file
+    part = partition_dir(root, key, value)
+    part.mkdir(parents=True, exist_ok=True)
+    _write_parquet(df, part / PART_FILE, sort_by)
+    for f in part.glob("*.parquet"):
+        if f.name != PART_FILE:
+            f.unlink()
+
+
+def add_partition_file(df: pd.DataFrame, root, key: str, value: str, file_name: str,
+                       sort_by: list[str] | None = None):
+    part = partition_dir(root, key, value)
+    part.mkdir(parents=True, exist_ok=True)
+    _write_parquet(df, part / file_name, sort_by)
+
+
+def files_dataset(files: list) -> ds.Dataset:
+    # files written by different runs or batches may disagree on all-null columns
+    schema = pa.unify_schemas([pq.read_schema(f) for f in files], promote_options="permissive")
+    return ds.dataset([str(f) for f in files], schema=schema, format="parquet")
+
+
+def _expression(filters) -> ds.Expression | None:
+    # filters: a pyarrow Expression or the DNF list form of pq.read_table, e.g.
+    # [("n_purchase", ">", 0)] (AND) or [[("n_purchase", ">", 0)], [("n_refund", ">", 0)]] (OR of ANDs)
+    if filters is None or isinstance(filters, ds.Expression):
+        return filters
+    return pq.filters_to_expression(filters) if filters else None
+
+
+def read_table(files: list, columns: list[str] | None = None, filters=None) -> pa.Table:
+    # projection and filters run inside the scan: other columns are never decoded and row groups
+    # whose min/max statistics rule the filter out are skipped. Columns a (older) file set does
+    # not have are left out, like the `if col in df.columns` checks of the callers
+    dataset = files_dataset(files)
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+    return dataset.to_table(columns=columns, filter=_expression(filters))
+
+
+def read(files: list, columns: list[str] | None = None, filters=None) -> pd.DataFrame:
+    return read_table(files, columns, filters).to_pandas()
+
+
+def concat_files(files: list, out_path):
+    # streams batch by batch, so the combined file never has to fit in memory
+    dataset = files_dataset(files)
+    tmp = out_path.with_name(f"{out_path.name}.tmp")
+    with pq.ParquetWriter(tmp, dataset.schema) as writer:
+        for batch in dataset.to_batches():
+            writer.write_batch(batch)
+    os.replace(tmp, out_path)
+
+
+def read_partitioned(root, key: str, values: list[str] | None = None,
+                     columns: list[str] | None = None, filters=None) -> pd.DataFrame:
+    # only the requested partitions are opened, the rest of the history is never scanned
+    files = partitioned_files(root, key, values)
+    if not files:
+        return pd.DataFrame()
+    return read(files, columns, filters)
+
+
+def read_events_clean(dates: list[str] | None = None, columns: list[str] | None = None,
+                      filters=None) -> pd.DataFrame:
+    if SILVER_EVENTS_DIR.exists():
+        return read_partitioned(SILVER_EVENTS_DIR, "event_date", dates, columns, filters)
+
+    if dates is None:
+        return read([SILVER_DIR / "events_clean.parquet"], columns, filters)
+    # the single legacy file has no event_date column, days are picked by timestamp
+    wanted = None if columns is None else list(dict.fromkeys(columns + ["event_ts_utc"]))
+    df = read([SILVER_DIR / "events_clean.parquet"], wanted, filters)
+    df = df[pd.to_datetime(df["event_ts_utc"]).dt.strftime("%Y-%m-%d").isin(dates)]
+    return df if columns is None else df[[c for c in columns if c in df.columns]]
+
+
+def read_user_daily(dates: list[str] | None = None, columns: list[str] | None = None,
+                    filters=None) -> pd.DataFrame:
+    if SILVER_USER_DAILY_DIR.exists():
+        return read_partitioned(SILVER_USER_DAILY_DIR, "event_date", dates, columns, filters)
+
+    expr = _expression(filters)
+    if dates is not None:
+        days = ds.field("event_date").isin(pa.array([pd.Timestamp(d) for d in dates], pa.timestamp("us")))
+        expr = days if expr is None else days & expr
+    return read([SILVER_DIR / "user_daily.parquet"], columns, expr)
+
+
+def read_marketing_clean(columns: list[str] | None = None, filters=None) -> pd.DataFrame:
+    if SILVER_MARKETING_DIR.exists():
+        return read_partitioned(SILVER_MARKETING_DIR, "date", columns=columns, filters=filters)
+    return read([SILVER_DIR / "marketing_spend_clean.parquet"], columns, filters)
@@ -1,8 +1,111 @@
 import os
+import time
 import duckdb
 from src.common.paths import PROJECT_ROOT
 
+# DuckDB defaults to all cores and 80% of RAM; cap them when the pipeline shares the machine
+THREADS = os.getenv("DUCKDB_THREADS")
+MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT")
+
+# seconds a publish step waits for BI readers in other processes to close their handles on the file
+LOCK_WAIT_S = float(os.getenv("DUCKDB_LOCK_WAIT_S", "30"))
+
+# "staged" builds replacement tables as <table>__staging next to the live ones and renames them
+# into place in one short transaction; "direct" drops and recreates inside the load transaction
+PUBLISH_MODE = os.getenv("DUCKDB_PUBLISH", "staged")
+STAGING_SUFFIX = "__staging"
+
+# one row per analytics publish; query results are cached per version (src.common.query_service)
+BUILD_TABLE = "ops.gold_build"
+
+# one database instance per publish step, opened on first use; every get_conn() is a cursor on it.
+# DuckDB allows one read-write process per file, so a step closes it (close()) right after its COMMIT
+# and readers in other processes can open the file between publish steps
+_DB = None
+
+
+def configure(con):
+    if THREADS:
+        con.execute(f"SET threads = {int(THREADS)};")
+    if MEMORY_LIMIT:
+        con.execute(f"SET memory_limit = '{MEMORY_LIMIT}';")
+    return con
+
+
+def db_path():
+    return (PROJECT_ROOT / os.getenv("DUCKDB_PATH", "./lakehouse/gold.duckdb")).resolve()
+
+
+def _open_for_write():
+    # readers hold the file only per query (src.common.query_service), so a gap comes up quickly
+    deadline = time.monotonic() + LOCK_WAIT_S
+    while True:
+        try:
+            return duckdb.connect(str(db_path()))
+        except duckdb.IOException:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+
 def get_conn():
-    db_path = os.getenv("DUCKDB_PATH", "./lakehouse/gold.duckdb")
-    full = (PROJECT_ROOT / db_path).resolve()
-    return duckdb.connect(str(full))
\ No newline at end of file
+    global _DB
+    if _DB is None:
+        _DB = configure(_open_for_write())
+    # closing a cursor leaves the shared instance (and its catalog and buffer cache) open
+    return _DB.cursor()
+
+
+def close():
+    # releases the file lock, for BI readers in other processes and the next step of a parallel run
+    global _DB
+    if _DB is not None:
+        _DB.close()
+        _DB = None
+
+
+def analytics_tables() -> set[str]:
+    # what is published so far, looked up before a step takes the write lock
+    if _DB is None and not db_path().exists():
+        return set()
+    con = _DB.cursor() if _DB is not None else duckdb.connect(str(db_path()), read_only=True)
+    try:
+        rows = con.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'analytics'").fetchall()
+    finally:
+        con.close()
+    return {r[0] for r in rows}
+
+
+def staging_name(table: str) -> str:
+    return f"{table}{STAGING_SUFFIX}"
+
+
+def staged_tables(con, schema: str) -> list[str]:
+    # live names of the tables waiting under their staging names
+    rows = con.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_schema = ? AND suffix(table_name, ?)",
+        [schema, STAGING_SUFFIX],
+    ).fetchall()
+    return sorted(r[0].removesuffix(STAGING_SUFFIX) for r in rows)
+
+
+def swap(con, schema: str, table: str):
+    # run inside the publishing transaction: readers see the old table until COMMIT, then the new one.
+    # Readers in other processes cannot open the file while a step holds it, they read between steps
+    con.execute(f"DROP TABLE IF EXISTS {schema}.{table};")
+    con.execute(f"ALTER TABLE {schema}.{staging_name(table)} RENAME TO {table};")
+
+
+def bump_build_version(con):
+    # run inside the publishing transaction, so the new version commits together with the tables
+    con.execute("CREATE SCHEMA IF NOT EXISTS ops;")
+    con.execute(f"CREATE TABLE IF NOT EXISTS {BUILD_TABLE} (version BIGINT, published_at TIMESTAMP);")
+    con.execute(f"INSERT INTO {BUILD_TABLE} SELECT COALESCE(MAX(version), 0) + 1, now() FROM {BUILD_TABLE};")
+
+
+def build_version(con) -> int:
+    # 0 until the first publish
+    try:
+        return con.execute(f"SELECT COALESCE(MAX(version), 0) FROM {BUILD_TABLE};").fetchone()[0]
+    except duckdb.CatalogException:
+        return 0
@@ -0,0 +1,94 @@
+import duckdb
+import pandas as pd
+
+from src.common.paths import STATE_DIR
+
+# event_id -> (event_ts_utc, _source_line_no, event_date) of the accepted silver row.
+# The primary key gives DuckDB an ART index, so probes and upserts cost O(batch), not O(history).
+INDEX_PATH = STATE_DIR / "event_index.duckdb"
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS event_index (
+    event_id VARCHAR PRIMARY KEY,
+    event_ts_utc TIMESTAMP,
+    source_line_no BIGINT,
+    event_date DATE
+)
+"""
+
+# same order as silver_events._keep_latest: newest timestamp, then latest line
+_LATEST_FIRST = "event_ts_utc DESC, source_line_no DESC"
+
+
+def _connect():
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    con = duckdb.connect(str(INDEX_PATH))
+    con.execute(_DDL)
+    return con
+
+
+def _keys(df: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame({
+        "event_id": df["event_id"].astype(str),
+        "event_ts_utc": df["event_ts_utc"],
+        "source_line_no": pd.to_numeric(df["_source_line_no"]).astype("int64"),
+    })
+
+
+def exists() -> bool:
+    return INDEX_PATH.exists()
+
+
+def reset():
+    # a full rebuild rewrites silver, the index is rebuilt from it by the next incremental run
+    for path in [INDEX_PATH, INDEX_PATH.with_name(INDEX_PATH.name + ".wal")]:
+        path.unlink(missing_ok=True)
+
+
+def rebuild(parquet_source: str):
+    # parquet_source is a DuckDB read_parquet(...) expression over the current silver events
+    reset()
+    con = _connect()
+    try:
+        con.execute(f"""
+            INSERT INTO event_index
+            SELECT event_id, event_ts_utc, source_line_no, CAST(event_ts_utc AS DATE)
+            FROM (
+                SELECT CAST(event_id AS VARCHAR) AS event_id,
+                       CAST(event_ts_utc AS TIMESTAMP) AS event_ts_utc,
+                       CAST(_source_line_no AS BIGINT) AS source_line_no
+                FROM {parquet_source}
+            )
+            QUALIFY row_number() OVER (PARTITION BY event_id ORDER BY {_LATEST_FIRST}) = 1
+        """)
+        return con.execute("SELECT COUNT(*) FROM event_index").fetchone()[0]
+    finally:
+        con.close()
+
+
+def probe(df: pd.DataFrame) -> pd.DataFrame:
+    # accepted rows for the batch's event_ids; ids never seen before are simply absent
+    con = _connect()
+    try:
+        con.register("batch_ids", _keys(df)[["event_id"]].drop_duplicates())
+        out = con.execute("""
+            SELECT i.event_id, i.event_ts_utc, i.source_line_no, i.event_date
+            FROM batch_ids b
+            JOIN event_index i USING (event_id)
+        """).df()
+    finally:
+        con.close()
+    out["event_date"] = pd.to_datetime(out["event_date"]).dt.strftime("%Y-%m-%d")
+    return out
+
+
+def upsert(df: pd.DataFrame):
+    con = _connect()
+    try:
+        con.register("batch", _keys(df))
+        con.execute("""
+            INSERT OR REPLACE INTO event_index
+            SELECT event_id, event_ts_utc, source_line_no, CAST(event_ts_utc AS DATE) FROM batch
+        """)
+    finally:
+        con.close()
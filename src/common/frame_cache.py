@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+import pandas as pd
+
+from src.common.logger import get_logger
+
+logger = get_logger("frame_cache")
+
+
+class FrameCache:
+    # size-capped LRU of DataFrames: frames larger than the cap are handed out uncached, least
+    # recently used ones are evicted first
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, pd.DataFrame]" = OrderedDict()
+        self._sizes: dict[tuple, int] = {}
+        self._total = 0
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._entries
+
+    def keys(self) -> list[tuple]:
+        return list(self._entries)
+
+    def get(self, key: tuple) -> pd.DataFrame | None:
+        df = self._entries.get(key)
+        if df is None:
+            return None
+        self._entries.move_to_end(key)
+        return self._share(df)
+
+    def put(self, key: tuple, df: pd.DataFrame) -> pd.DataFrame:
+        size = int(df.memory_usage(deep=True).sum())
+        self.drop(lambda k: k == key)
+        if size <= self.max_bytes:
+            self._entries[key] = df
+            self._sizes[key] = size
+            self._total += size
+            while self._total > self.max_bytes:
+                old, _ = self._entries.popitem(last=False)
+                self._total -= self._sizes.pop(old)
+                logger.info(f"{self.name} cache evicted key={str(old)[:80]}")
+        return self._share(df)
+
+    def drop(self, predicate=None):
+        for key in [k for k in self._entries if predicate is None or predicate(k)]:
+            self._entries.pop(key)
+            self._total -= self._sizes.pop(key)
+
+    @staticmethod
+    def _share(df: pd.DataFrame) -> pd.DataFrame:
+        # shallow copy: under copy-on-write (always on from pandas 3, the requirements floor), column
+        # writes by the caller never reach the cached frame
+        return df.copy(deep=False)
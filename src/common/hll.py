@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# "exact" (nunique), "approx" (HyperLogLog estimate in place of the exact count) or
+# "both" (exact column plus an *_approx column next to it, for validation)
+DISTINCT_MODE = os.getenv("GOLD_DISTINCT_MODE", "exact")
+
+# 2^p one-byte registers per sketch; relative standard error ~ 1.04 / sqrt(2^p)
+PRECISION = int(os.getenv("HLL_PRECISION", "14"))
+
+
+def approx_enabled() -> bool:
+    return DISTINCT_MODE in ("approx", "both")
+
+
+def exact_enabled() -> bool:
+    return DISTINCT_MODE in ("exact", "both")
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    # exact bit length of uint64 values, binary search instead of float log2
+    n = np.zeros(len(x), dtype=np.int64)
+    x = x.copy()
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+
+def _index_and_rank(values: pd.Series, precision: int) -> tuple[np.ndarray, np.ndarray]:
+    # pandas' hash is stable across processes and runs, so sketches from different runs merge;
+    # integer keys (user_key) are hashed as they are, anything else as text
+    if pd.api.types.is_integer_dtype(values):
+        h = pd.util.hash_array(values.to_numpy(dtype="int64"))
+    else:
+        h = pd.util.hash_array(values.astype(str).to_numpy(dtype=object))
+    rest_bits = 64 - precision
+    idx = (h >> np.uint64(rest_bits)).astype(np.int64)
+    rest = h & np.uint64((1 << rest_bits) - 1)
+    rank = (rest_bits - _bit_length(rest) + 1).astype(np.uint8)
+    return idx, rank
+
+
+def sketch_groups(keys: pd.DataFrame, values: pd.Series, precision: int = PRECISION) -> tuple[pd.DataFrame, np.ndarray]:
+    # one sketch per distinct row of `keys`: (unique keys, registers of shape (n_keys, 2^p))
+    idx, rank = _index_and_rank(values, precision)
+    cells = keys.reset_index(drop=True).assign(_idx=idx, _rank=rank)
+    cols = list(keys.columns)
+    best = cells.groupby(cols + ["_idx"], sort=True, as_index=False)["_rank"].max()
+
+    groups = best[cols].drop_duplicates().reset_index(drop=True)
+    codes = best.groupby(cols, sort=True).ngroup().to_numpy()
+    registers = np.zeros((len(groups), 1 << precision), dtype=np.uint8)
+    registers[codes, best["_idx"].to_numpy()] = best["_rank"].to_numpy()
+    return groups, registers
+
+
+def estimate(registers: np.ndarray) -> np.ndarray:
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.power(2.0, -registers.astype(np.float64)), axis=1)
+
+    # small-range correction (linear counting); 64-bit hashes need no large-range one
+    zeros = np.count_nonzero(registers == 0, axis=1)
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    out = raw.copy()
+    out[small] = m * np.log(m / zeros[small])
+    return np.rint(out).astype(np.int64)
+
+
+def merge(registers: np.ndarray) -> np.ndarray:
+    # union of the sets behind the sketches
+    return np.max(np.atleast_2d(registers), axis=0)
+
+
+def to_bytes(registers: np.ndarray) -> list[bytes]:
+    return [row.tobytes() for row in np.atleast_2d(registers)]
+
+
+def from_bytes(blobs) -> np.ndarray:
+    return np.stack([np.frombuffer(b, dtype=np.uint8) for b in blobs])
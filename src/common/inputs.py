@@ -0,0 +1,38 @@
+import glob
+import io
+from pathlib import Path
+
+import pyarrow as pa
+
+from src.common.paths import DATA_DIR
+
+# decompressed on the fly by pyarrow's codecs, no extra dependency
+CODECS = {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+
+
+def is_pattern(spec: str) -> bool:
+    return any(c in spec for c in "*?[")
+
+
+def expand(spec: str) -> list[Path]:
+    # shards in name order, which upstream's hourly naming makes arrival order
+    if not is_pattern(spec):
+        return [Path(spec)]
+    return sorted(Path(p) for p in glob.glob(spec, recursive=True) if Path(p).is_file())
+
+
+def is_compressed(path: Path) -> bool:
+    return Path(path).suffix in CODECS
+
+
+def open_text(path: Path):
+    codec = CODECS.get(Path(path).suffix)
+    if codec is None:
+        return open(path, "r", encoding="utf-8")
+    return io.TextIOWrapper(pa.CompressedInputStream(pa.OSFile(str(path)), codec), encoding="utf-8")
+
+
+def source_name(path: Path) -> str:
+    # what _source_file records and the shard watermark remembers
+    path = Path(path).resolve()
+    return path.relative_to(DATA_DIR).as_posix() if path.is_relative_to(DATA_DIR) else path.name
@@ -0,0 +1,11 @@
+import pandas as pd
+
+
+def signed_amount(event_type: pd.Series, amount: pd.Series) -> pd.Series:
+    # purchase = +amount, refund = -abs(amount)
+    return amount.where(event_type == "purchase", -amount.abs())
+
+
+def safe_divide(numerator: pd.Series, denominator: pd.Series) -> pd.Series:
+    # NaN (null in Parquet) instead of inf / errors when the denominator is not positive
+    return (numerator / denominator).where(denominator > 0)
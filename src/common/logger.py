@@ -24,12 +24,26 @@ def start_run(run_window: str = "-", pipeline_name: str = "lakehouse-mini") -> d
 
     pipeline_id = _make_pipeline_id(f"{pipeline_name}|{started}")
 
-    _RUN_ID.set(run_id)
-    _RUN_STARTED_AT.set(started)
-    _RUN_WINDOW.set(run_window)
-    _PIPELINE_ID.set(pipeline_id)
-
-    return {"run_id": run_id, "started_at": started, "window": run_window, "pipeline_id": pipeline_id}
+    run_info = {"run_id": run_id, "started_at": started, "window": run_window, "pipeline_id": pipeline_id}
+    set_run_context(run_info)
+    return run_info
+
+
+def get_run_context() -> dict:
+    return {
+        "run_id": _RUN_ID.get(),
+        "started_at": _RUN_STARTED_AT.get(),
+        "window": _RUN_WINDOW.get(),
+        "pipeline_id": _PIPELINE_ID.get(),
+    }
+
+
+def set_run_context(run_info: dict):
+    # worker processes re-apply the parent's run so their log lines carry the same ids
+    _RUN_ID.set(run_info["run_id"])
+    _RUN_STARTED_AT.set(run_info["started_at"])
+    _RUN_WINDOW.set(run_info["window"])
+    _PIPELINE_ID.set(run_info["pipeline_id"])
 
 
 class _RunContextFilter(logging.Filter):
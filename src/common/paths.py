@@ -16,4 +16,23 @@ QUARANTINE_DIR = LAKEHOUSE_DIR / "quarantine"
 
 EVENTS_NDJSON = DATA_DIR / "events.ndjson"
 SUBSCRIPTIONS_JSON = DATA_DIR / "subscriptions.json"
-MARKETING_CSV = DATA_DIR / "marketing_spend.csv"
\ No newline at end of file
+MARKETING_CSV = DATA_DIR / "marketing_spend.csv"
+
+# each source may also be a glob of shards relative to DATA_DIR, plain or .gz/.zst compressed,
+# e.g. EVENTS_INPUT="events/*.ndjson.gz"; the default is the single file above
+EVENTS_INPUT = str(DATA_DIR / os.getenv("EVENTS_INPUT", EVENTS_NDJSON.name))
+SUBSCRIPTIONS_INPUT = str(DATA_DIR / os.getenv("SUBSCRIPTIONS_INPUT", SUBSCRIPTIONS_JSON.name))
+MARKETING_INPUT = str(DATA_DIR / os.getenv("MARKETING_INPUT", MARKETING_CSV.name))
+
+# date-partitioned silver layout used by incremental runs
+SILVER_EVENTS_DIR = SILVER_DIR / "events_clean"
+SILVER_MARKETING_DIR = SILVER_DIR / "marketing_spend_clean"
+
+# (event_date, user_key) activity rollup the gold KPIs read instead of the raw events
+SILVER_USER_DAILY_DIR = SILVER_DIR / "user_daily"
+
+# per-source watermarks for incremental runs
+STATE_DIR = LAKEHOUSE_DIR / "_state"
+
+# per-step run metrics and optional profiles
+METRICS_DIR = LAKEHOUSE_DIR / "metrics"
@@ -0,0 +1,112 @@
+import os
+import re
+import time
+import duckdb
+import pandas as pd
+
+from src.common import db
+from src.common.frame_cache import FrameCache
+from src.common.logger import get_logger
+
+logger = get_logger("query_service")
+
+MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# seconds a looked-up gold build version is trusted (0 = look it up on every query). Publishes in
+# this process invalidate at once; the lookup notices loads made by another process (the pipeline)
+VERSION_CHECK_S = float(os.getenv("QUERY_CACHE_VERSION_CHECK_S", "1"))
+
+_CACHE = FrameCache("query", MAX_BYTES)
+_VERSION: int | None = None
+_CHECKED_AT = 0.0
+
+# quoted literals and identifiers are kept verbatim, everything else is case- and whitespace-folded
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_READS = ("select", "with", "from", "table", "(")
+
+
+def normalize_sql(sql: str) -> str:
+    parts = _QUOTED.split(sql)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", _COMMENT.sub(" ", parts[i])).lower()
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _param_key(value):
+    # hashable stand-in for a parameter: lists (IN ?, = ANY(?)) and dicts (structs) become tuples, and
+    # the type is kept so 1, 1.0 and True, which hash alike, do not share a cached result
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, tuple(_param_key(v) for v in value)
+    if isinstance(value, dict):
+        return "dict", tuple((k, _param_key(v)) for k, v in value.items())
+    return type(value).__name__, value
+
+
+def _connect():
+    # not db.get_conn(): DuckDB lets only one process open the file for writing, so a dashboard
+    # holding it would block the next publish. A read-only handle is opened per version check or
+    # cache miss and closed at once; a publish still needs a moment with no such handle open
+    return db.configure(duckdb.connect(str(db.db_path()), read_only=True))
+
+
+def _current_version() -> int:
+    global _VERSION, _CHECKED_AT
+    now = time.monotonic()
+    if _VERSION is None or now - _CHECKED_AT >= VERSION_CHECK_S:
+        try:
+            con = _connect()
+        except duckdb.IOException as e:
+            if _VERSION is None:
+                raise
+            # the pipeline holds the file while it publishes: keep serving the cached build
+            logger.info(f"Query cache kept version={_VERSION}: database locked ({e})")
+            _CHECKED_AT = now
+            return _VERSION
+        try:
+            version = db.build_version(con)
+        finally:
+            con.close()
+        if _VERSION is not None and version != _VERSION:
+            logger.info(f"Query cache cleared: gold build version {_VERSION} -> {version}")
+            _CACHE.drop()
+        _VERSION, _CHECKED_AT = version, now
+    return _VERSION
+
+
+def _execute(sql: str, params: tuple) -> pd.DataFrame:
+    con = _connect()
+    try:
+        return con.execute(sql, list(params)).df()
+    finally:
+        con.close()
+
+
+def query(sql: str, params=None) -> pd.DataFrame:
+    params = tuple(params or ())
+    normalized = normalize_sql(sql)
+    if not normalized.startswith(_READS):
+        # the handle is read-only; writes belong to the pipeline's publish steps
+        raise ValueError(f"query_service only runs read queries: {normalized[:80]}")
+
+    key = (normalized, tuple(_param_key(p) for p in params), _current_version())
+    try:
+        hash(key)
+    except TypeError:
+        # a parameter type with no hashable form (e.g. a numpy array) runs uncached
+        return _execute(sql, params)
+    df = _CACHE.get(key)
+    if df is not None:
+        logger.debug(f"Query cache hit rows={len(df)}")
+        return df
+
+    df = _execute(sql, params)
+    logger.debug(f"Query cache miss rows={len(df)}")
+    return _CACHE.put(key, df)
+
+
+def invalidate():
+    # called after every analytics publish in this process; the next query re-reads the version
+    global _VERSION
+    _CACHE.drop()
+    _VERSION = None
@@ -0,0 +1,181 @@
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from src.common.db import get_conn
+from src.common.logger import get_logger, get_run_context
+from src.common.paths import METRICS_DIR
+
+logger = get_logger("run_metrics")
+
+# "" (off), "cprofile" or "pyinstrument": one profile file per step under METRICS_DIR/profiles/<run_id>/
+PROFILE = os.getenv("PIPELINE_PROFILE", "").lower()
+
+RUN_METRICS_PATH = METRICS_DIR / "run_metrics.parquet"
+
+COLUMNS = [
+    "run_id", "pipeline_id", "run_started_at", "step", "status", "started_at",
+    "duration_s", "cpu_s", "peak_rss_mb", "bytes_read", "bytes_written",
+    "rows_in", "rows_out", "profile_path",
+]
+
+
+def _proc_io() -> tuple[int, int] | None:
+    # rchar/wchar count every read()/write() of the process (page cache included), pyarrow threads too
+    try:
+        with open("/proc/self/io", encoding="utf-8") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _reset_peak_rss():
+    # "5" resets VmHWM on Linux, so the peak below belongs to this step and not to an earlier one
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # process-lifetime peak; ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+def count_rows(paths: list[Path]) -> int | None:
+    # Parquet footers only, no data pages are read; None when nothing countable exists
+    total = None
+    for p in paths:
+        if p.is_dir():
+            files = sorted(p.rglob("*.parquet"))
+        elif p.suffix == ".parquet" and p.exists():
+            files = [p]
+        else:
+            continue
+        for f in files:
+            total = (total or 0) + pq.ParquetFile(f).metadata.num_rows
+    return total
+
+
+def _start_profiler(step_name: str):
+    if PROFILE == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    if PROFILE == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning(f"PIPELINE_PROFILE=pyinstrument but pyinstrument is not installed step={step_name}")
+            return None
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    return None
+
+
+def _stop_profiler(profiler, step_name: str) -> str | None:
+    if profiler is None:
+        return None
+    out_dir = METRICS_DIR / "profiles" / get_run_context()["run_id"]
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if PROFILE == "cprofile":
+        profiler.disable()
+        out_path = out_dir / f"{step_name}.prof"
+        profiler.dump_stats(out_path)
+    else:
+        profiler.stop()
+        out_path = out_dir / f"{step_name}.html"
+        out_path.write_text(profiler.output_html(), encoding="utf-8")
+    return str(out_path)
+
+
+def start_step(step_name: str, input_paths: list[Path] = ()) -> dict:
+    rows_in = count_rows(list(input_paths))
+    _reset_peak_rss()
+    meter = {
+        "step": step_name,
+        "rows_in": rows_in,
+        "started_at": pd.Timestamp.now(tz="UTC"),
+        "wall": time.perf_counter(),
+        "cpu": time.process_time(),
+        "io": _proc_io(),
+    }
+    meter["profiler"] = _start_profiler(step_name)
+    return meter
+
+
+def finish_step(meter: dict, status: str, output_paths: list[Path] = ()) -> dict:
+    wall = time.perf_counter() - meter["wall"]
+    cpu = time.process_time() - meter["cpu"]
+    io_end = _proc_io()
+    profile_path = _stop_profiler(meter["profiler"], meter["step"])
+    io_start = meter["io"]
+    run = get_run_context()
+    return {
+        "run_id": run["run_id"],
+        "pipeline_id": run["pipeline_id"],
+        "run_started_at": run["started_at"],
+        "step": meter["step"],
+        "status": status,
+        "started_at": meter["started_at"],
+        "duration_s": round(wall, 3),
+        "cpu_s": round(cpu, 3),
+        "peak_rss_mb": _peak_rss_mb(),
+        "bytes_read": io_end[0] - io_start[0] if io_start and io_end else None,
+        "bytes_written": io_end[1] - io_start[1] if io_start and io_end else None,
+        "rows_in": meter["rows_in"],
+        "rows_out": count_rows(list(output_paths)),
+        "profile_path": profile_path,
+    }
+
+
+def write_run_metrics(step_metrics: list[dict]):
+    if not step_metrics:
+        return
+    df = pd.DataFrame(step_metrics, columns=COLUMNS)
+    for c in ["bytes_read", "bytes_written", "rows_in", "rows_out"]:
+        df[c] = df[c].astype("Int64")
+    df["peak_rss_mb"] = df["peak_rss_mb"].astype("Float64")
+    df["profile_path"] = df["profile_path"].astype("string")
+
+    # one file appended run after run, so nightly runs can be compared step by step
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    if RUN_METRICS_PATH.exists():
+        df = pd.concat([pd.read_parquet(RUN_METRICS_PATH), df], ignore_index=True)
+    tmp_path = RUN_METRICS_PATH.with_suffix(".parquet.tmp")
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, RUN_METRICS_PATH)
+    logger.info(f"Wrote: {RUN_METRICS_PATH} steps={len(step_metrics)} total_rows={len(df)}")
+
+    # metrics are diagnostics: a locked or missing warehouse must not fail the run that produced them
+    try:
+        con = get_conn()
+        try:
+            con.execute("CREATE SCHEMA IF NOT EXISTS ops;")
+            con.execute(
+                f"CREATE OR REPLACE TABLE ops.run_metrics AS SELECT * FROM read_parquet('{RUN_METRICS_PATH.as_posix()}');"
+            )
+        finally:
+            con.close()
+        logger.info(f"Loaded table=ops.run_metrics rows={len(df)}")
+    except Exception as e:
+        logger.warning(f"Could not load ops.run_metrics error={e}")
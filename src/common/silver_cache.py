@@ -0,0 +1,89 @@
+import os
+
+import pandas as pd
+
+from src.common.datasets import read, read_events_clean, read_marketing_clean, read_user_daily
+from src.common.frame_cache import FrameCache
+from src.common.logger import get_logger
+from src.common.paths import SILVER_DIR
+
+logger = get_logger("silver_cache")
+
+MAX_BYTES = int(os.getenv("SILVER_CACHE_MAX_MB", "4096")) * 1024 * 1024
+
+_CACHE = FrameCache("silver", MAX_BYTES)
+
+
+def normalize_events(df: pd.DataFrame) -> pd.DataFrame:
+    # the normalization every gold step used to repeat on its own copy
+    if "event_type" in df.columns:
+        df["event_type"] = df["event_type"].astype(str).str.strip().str.lower()
+    if "user_id" in df.columns:
+        df["user_id"] = df["user_id"].astype(str).str.strip()
+    if "user_key" in df.columns:
+        # nullable: ids that are not users carry no key
+        df["user_key"] = df["user_key"].astype("Int64")
+    return df
+
+
+def _load(name: str, dates: list[str] | None, columns: list[str] | None, filters) -> pd.DataFrame:
+    if name == "events":
+        return normalize_events(read_events_clean(dates, columns, filters))
+    if name == "user_daily":
+        return read_user_daily(dates, columns, filters)
+    if name == "marketing":
+        return read_marketing_clean(columns, filters)
+    if name == "subscriptions":
+        return read([SILVER_DIR / "subscriptions_clean.parquet"], columns, filters)
+    raise ValueError(f"Unknown silver table: {name}")
+
+
+def _cached_superset(key: tuple, columns: list[str] | None) -> tuple | None:
+    # a table already read with more columns (same dates and filters) serves a narrower projection
+    if columns is None:
+        return None
+    for name, dates, cols, filters in _CACHE.keys():
+        if (name, dates, filters) == (key[0], key[1], key[3]) and (cols is None or set(columns) <= set(cols)):
+            return name, dates, cols, filters
+    return None
+
+
+def get(name: str, dates: list[str] | None = None, columns: list[str] | None = None,
+        filters=None) -> pd.DataFrame:
+    # columns / filters are pushed into the Parquet scan (datasets.read_table); each gold step asks
+    # only for what it uses, and the projection is part of the cache key
+    key = (name, tuple(dates) if dates is not None else None,
+           tuple(columns) if columns is not None else None, repr(filters) if filters is not None else None)
+
+    hit = key if key in _CACHE else _cached_superset(key, columns)
+    if hit is not None:
+        df = _CACHE.get(hit)
+        if hit != key:
+            df = df[[c for c in columns if c in df.columns]]
+        logger.info(f"Silver cache hit table={name} rows={len(df)} columns={len(df.columns)}")
+        return df
+
+    df = _load(name, dates, columns, filters)
+    logger.info(f"Silver cache load table={name} rows={len(df)} columns={len(df.columns)} "
+                f"bytes={int(df.memory_usage(deep=True).sum())}")
+    return _CACHE.put(key, df)
+
+
+def events(dates: list[str] | None = None, columns: list[str] | None = None, filters=None) -> pd.DataFrame:
+    return get("events", dates, columns, filters)
+
+
+def user_daily(dates: list[str] | None = None, columns: list[str] | None = None, filters=None) -> pd.DataFrame:
+    return get("user_daily", dates, columns, filters)
+
+
+def marketing(columns: list[str] | None = None, filters=None) -> pd.DataFrame:
+    return get("marketing", columns=columns, filters=filters)
+
+
+def subscriptions(columns: list[str] | None = None, filters=None) -> pd.DataFrame:
+    return get("subscriptions", columns=columns, filters=filters)
+
+
+def invalidate(name: str | None = None):
+    _CACHE.drop(lambda k: name is None or k[0] == name)
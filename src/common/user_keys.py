@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.common.paths import SILVER_DIR
+
+# user_id -> user_key (int64). Append-only: a key is never reassigned, so gold facts and
+# state keyed by user_key stay valid across incremental runs and full rebuilds
+KEYS_PATH = SILVER_DIR / "user_keys.parquet"
+
+# ids the gold layer never counted as users; they get no key
+_INVALID = ["", "none", "nan"]
+
+
+def normalize(user_id: pd.Series) -> pd.Series:
+    return user_id.astype(str).str.strip()
+
+
+def load() -> pd.DataFrame:
+    if not KEYS_PATH.exists():
+        return pd.DataFrame({"user_id": pd.Series(dtype=str), "user_key": pd.Series(dtype="int64")})
+    return pd.read_parquet(KEYS_PATH)
+
+
+def _save(keys: pd.DataFrame):
+    KEYS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = KEYS_PATH.with_suffix(".parquet.tmp")
+    keys.to_parquet(tmp, index=False)
+    os.replace(tmp, KEYS_PATH)
+
+
+def assign(user_id: pd.Series) -> pd.Series:
+    # keys for a silver batch: unseen ids get the next free keys (in sorted order), invalid ids <NA>
+    ids = normalize(user_id)
+    valid = ids.notna() & ~ids.str.lower().isin(_INVALID)
+
+    keys = load()
+    new = pd.Index(ids[valid].unique()).difference(pd.Index(keys["user_id"]))
+    if len(new):
+        start = int(keys["user_key"].max()) + 1 if len(keys) else 1
+        added = pd.DataFrame({
+            "user_id": new.astype(str),
+            "user_key": np.arange(start, start + len(new), dtype="int64"),
+        })
+        keys = pd.concat([keys, added], ignore_index=True)
+        _save(keys)
+
+    mapping = pd.Series(keys["user_key"].to_numpy(), index=keys["user_id"].to_numpy())
+    return ids.map(mapping).where(valid).astype("Int64")
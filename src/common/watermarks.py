@@ -0,0 +1,72 @@
+import json
+import os
+
+from src.common.paths import STATE_DIR
+
+SOURCES = ["events", "subscriptions", "marketing"]
+
+
+def _state_path(source: str):
+    # one file per source so independent steps never rewrite each other's state
+    return STATE_DIR / f"{source}.json"
+
+
+def _load(source: str) -> dict:
+    path = _state_path(source)
+    if not path.exists():
+        return {"committed": None, "pending": None, "dirty_dates": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save(source: str, state: dict):
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _state_path(source)
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def get_watermark(source: str):
+    return _load(source)["committed"]
+
+
+def get_pending(source: str):
+    return _load(source)["pending"]
+
+
+def set_pending(source: str, value: dict):
+    state = _load(source)
+    state["pending"] = value
+    _save(source, state)
+
+
+def get_dirty_dates(source: str) -> list[str]:
+    return _load(source)["dirty_dates"]
+
+
+def add_dirty_dates(source: str, dates: list[str]):
+    state = _load(source)
+    state["dirty_dates"] = sorted(set(state["dirty_dates"]) | set(dates))
+    _save(source, state)
+
+
+def commit(source: str):
+    # only called once the whole run succeeded, so a failed run is simply replayed
+    state = _load(source)
+    if state["pending"] is not None:
+        state["committed"] = state["pending"]
+    state["pending"] = None
+    state["dirty_dates"] = []
+    _save(source, state)
+
+
+def commit_all():
+    for source in SOURCES:
+        commit(source)
+
+
+def reset_all():
+    for source in SOURCES:
+        _state_path(source).unlink(missing_ok=True)
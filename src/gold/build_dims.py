@@ -1,27 +1,88 @@
 import pandas as pd
+import pyarrow as pa
 
+from src.common import db, query_service, silver_cache, user_keys
 from src.common.db import get_conn
 from src.common.logger import get_logger
-from src.common.paths import SILVER_DIR
 
 logger = get_logger("gold_dims")
 
+DIMS = ["dim_date", "dim_channel", "dim_plan", "dim_user"]
 
-def main():
-    con = get_conn()
-    con.execute("CREATE SCHEMA IF NOT EXISTS analytics;")
+# dim_date spans every date seen in the sources; the other dims need a few columns each
+EVENT_COLUMNS = ["event_ts_utc", "user_key", "event_type", "acquisition_channel"]
+SUBSCRIPTION_COLUMNS = ["start_date", "end_date", "plan_id", "price", "currency"]
+MARKETING_COLUMNS = ["date", "channel"]
+
+
+def _arrow(df: pd.DataFrame) -> pa.Table:
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _create_dims(con, name: dict[str, str], dim_date: pd.DataFrame, mkt: pd.DataFrame, subs: pd.DataFrame,
+                 events: pd.DataFrame, keys: pd.DataFrame) -> tuple:
+    # frames go in as Arrow tables of just the columns each dim reads
+    con.register("dim_date_df", _arrow(dim_date))
+    con.execute(f"CREATE OR REPLACE TABLE analytics.{name['dim_date']} AS SELECT * FROM dim_date_df;")
+
+    con.register("mkt_df", _arrow(mkt[["channel"]]))
+    con.execute(
+        f"CREATE OR REPLACE TABLE analytics.{name['dim_channel']} AS SELECT DISTINCT channel FROM mkt_df ORDER BY channel;"
+    )
+
+    con.register("subs_df", _arrow(subs[["plan_id", "price", "currency"]]))
+    con.execute(
+        f"""
+        CREATE OR REPLACE TABLE analytics.{name['dim_plan']} AS
+        SELECT DISTINCT plan_id, price, currency
+        FROM subs_df
+        ORDER BY plan_id;
+        """
+    )
+
+    # the only place the string user_id is joined back to the integer user_key of the facts
+    con.register("events_df", _arrow(events[["user_key", "event_type", "acquisition_channel"]]))
+    con.register("user_keys_df", _arrow(keys))
+    con.execute(
+        f"""
+        CREATE OR REPLACE TABLE analytics.{name['dim_user']} AS
+        SELECT
+            e.user_key,
+            k.user_id,
+            e.acquisition_channel
+        FROM (
+            SELECT
+                user_key,
+                MIN(CASE WHEN event_type='signup' THEN acquisition_channel END) AS acquisition_channel
+            FROM events_df
+            WHERE user_key IS NOT NULL
+            GROUP BY user_key
+        ) e
+        JOIN user_keys_df k ON k.user_key = e.user_key
+        ORDER BY k.user_id;
+        """
+    )
+
+    return con.execute(
+        f"""
+        SELECT
+            (SELECT COUNT(*) FROM analytics.{name['dim_date']}) AS dim_date_rows,
+            (SELECT COUNT(*) FROM analytics.{name['dim_channel']}) AS dim_channel_rows,
+            (SELECT COUNT(*) FROM analytics.{name['dim_plan']}) AS dim_plan_rows,
+            (SELECT COUNT(*) FROM analytics.{name['dim_user']}) AS dim_user_rows
+        """
+    ).fetchone()
 
-    events_path = SILVER_DIR / "events_clean.parquet"
-    subs_path = SILVER_DIR / "subscriptions_clean.parquet"
-    mkt_path = SILVER_DIR / "marketing_spend_clean.parquet"
 
-    events = pd.read_parquet(events_path)
-    subs = pd.read_parquet(subs_path)
-    mkt = pd.read_parquet(mkt_path)
+def main(publish: bool = True):
+    events = silver_cache.events(columns=EVENT_COLUMNS)
+    subs = silver_cache.subscriptions(SUBSCRIPTION_COLUMNS)
+    mkt = silver_cache.marketing(MARKETING_COLUMNS)
 
     logger.info(f"Read events rows={len(events)}")
     logger.info(f"Read subscriptions rows={len(subs)}")
     logger.info(f"Read marketing rows={len(mkt)}")
+    keys = user_keys.load()
 
     dates = set()
 
@@ -50,56 +111,41 @@ def main():
         pd.to_datetime(dim_date["date"]) - pd.to_timedelta(pd.to_datetime(dim_date["date"]).dt.weekday, unit="D")
     ).dt.date
 
-    con.execute("DROP TABLE IF EXISTS analytics.dim_date;")
-    con.register("dim_date_df", dim_date)
-    con.execute("CREATE TABLE analytics.dim_date AS SELECT * FROM dim_date_df;")
-
-    con.execute("DROP TABLE IF EXISTS analytics.dim_channel;")
-    con.register("mkt_df", mkt)
-    con.execute("CREATE TABLE analytics.dim_channel AS SELECT DISTINCT channel FROM mkt_df ORDER BY channel;")
-
-    con.execute("DROP TABLE IF EXISTS analytics.dim_plan;")
-    con.register("subs_df", subs)
-    con.execute(
-        """
-        CREATE TABLE analytics.dim_plan AS
-        SELECT DISTINCT plan_id, price, currency
-        FROM subs_df
-        ORDER BY plan_id;
-        """
-    )
-
-    con.execute("DROP TABLE IF EXISTS analytics.dim_user;")
-    con.register("events_df", events)
-    con.execute(
-        """
-        CREATE TABLE analytics.dim_user AS
-        SELECT
-            user_id,
-            MIN(CASE WHEN event_type='signup' THEN acquisition_channel END) AS acquisition_channel
-        FROM events_df
-        WHERE user_id IS NOT NULL AND TRIM(CAST(user_id AS VARCHAR)) <> ''
-        GROUP BY user_id
-        ORDER BY user_id;
-        """
-    )
-
-    dim_counts = con.execute(
-        """
-        SELECT
-            (SELECT COUNT(*) FROM analytics.dim_date) AS dim_date_rows,
-            (SELECT COUNT(*) FROM analytics.dim_channel) AS dim_channel_rows,
-            (SELECT COUNT(*) FROM analytics.dim_plan) AS dim_plan_rows,
-            (SELECT COUNT(*) FROM analytics.dim_user) AS dim_user_rows
-        """
-    ).fetchone()
+    # staged: dims are built under their staging names and renamed into place together at the end;
+    # direct: built in place inside one transaction. The write lock is taken only from here on
+    staged = db.PUBLISH_MODE == "staged"
+    name = {t: db.staging_name(t) if staged else t for t in DIMS}
+    con = get_conn()
+    try:
+        con.execute("CREATE SCHEMA IF NOT EXISTS analytics;")
+        if staged:
+            dim_counts = _create_dims(con, name, dim_date, mkt, subs, events, keys)
+
+        # staged and not publishing: gold_build_views swaps the dims in together with the facts
+        if publish or not staged:
+            con.execute("BEGIN TRANSACTION;")
+            try:
+                if staged:
+                    for t in DIMS:
+                        db.swap(con, "analytics", t)
+                else:
+                    dim_counts = _create_dims(con, name, dim_date, mkt, subs, events, keys)
+                if publish:
+                    db.bump_build_version(con)
+                con.execute("COMMIT;")
+            except Exception:
+                con.execute("ROLLBACK;")
+                raise
+    finally:
+        con.close()
+        db.close()
+    if publish:
+        query_service.invalidate()
 
     logger.info(
         f"Built dims: dim_date={dim_counts[0]} dim_channel={dim_counts[1]} dim_plan={dim_counts[2]} dim_user={dim_counts[3]}"
     )
 
-    con.close()
-
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
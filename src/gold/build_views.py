@@ -1,17 +1,20 @@
+import os
+import re
+
+from src.common import db, query_service
 from src.common.db import get_conn
 from src.common.logger import get_logger
 
 logger = get_logger("gold_views")
 
+# "materialized" (default) stores each view's result as a pre-joined, sorted analytics.mv_* table and
+# keeps analytics.vw_* as a plain alias of it; "view" re-runs the joins on every query
+VIEWS_MODE = os.getenv("ANALYTICS_VIEWS", "materialized")
 
-def main():
-    con = get_conn()
-    con.execute("CREATE SCHEMA IF NOT EXISTS analytics;")
-
-    con.execute("DROP VIEW IF EXISTS analytics.vw_daily_kpis;")
-    con.execute(
+# view name -> (query, sort order of the materialized table)
+VIEWS = {
+    "vw_daily_kpis": (
         """
-        CREATE VIEW analytics.vw_daily_kpis AS
         SELECT
             d.date,
             d.year,
@@ -26,14 +29,12 @@ def main():
         LEFT JOIN analytics.fact_daily_revenue_gross rg
           ON rg.event_date = dau.event_date
         LEFT JOIN analytics.fact_daily_revenue_net rn
-          ON rn.event_date = dau.event_date;
-        """
-    )
-
-    con.execute("DROP VIEW IF EXISTS analytics.vw_cac_by_channel;")
-    con.execute(
+          ON rn.event_date = dau.event_date
+        """,
+        "date",
+    ),
+    "vw_cac_by_channel": (
         """
-        CREATE VIEW analytics.vw_cac_by_channel AS
         SELECT
             c.channel,
             f.paid_conversions,
@@ -41,13 +42,12 @@ def main():
             f.cac
         FROM analytics.fact_cac_by_channel f
         JOIN analytics.dim_channel c
-          ON c.channel = f.channel;
+          ON c.channel = f.channel
+        """,
+        "channel",
+    ),
+    "vw_mrr_daily": (
         """
-    )
-    con.execute("DROP VIEW IF EXISTS analytics.vw_mrr_daily;")
-    con.execute(
-        """
-        CREATE VIEW analytics.vw_mrr_daily AS
         SELECT
             d.date,
             d.year,
@@ -55,49 +55,99 @@ def main():
             m.mrr
         FROM analytics.fact_mrr_daily m
         JOIN analytics.dim_date d
-          ON d.date = CAST(m.date AS DATE);
-        """
-    )
-
-    con.execute("DROP VIEW IF EXISTS analytics.vw_user_ltv;")
-    con.execute(
+          ON d.date = CAST(m.date AS DATE)
+        """,
+        "date",
+    ),
+    "vw_user_ltv": (
         """
-        CREATE VIEW analytics.vw_user_ltv AS
         SELECT
             u.user_id,
             u.acquisition_channel,
             ltv.ltv
         FROM analytics.fact_ltv_per_user ltv
         JOIN analytics.dim_user u
-          ON u.user_id = ltv.user_id;
-        """
-    )
-
-    con.execute("DROP VIEW IF EXISTS analytics.vw_weekly_retention;")
-    con.execute(
+          ON u.user_key = ltv.user_key
+        """,
+        # lookups by user_id skip row groups by their min/max
+        "user_id",
+    ),
+    "vw_weekly_retention": (
         """
-        CREATE VIEW analytics.vw_weekly_retention AS
         SELECT
             cohort_week,
             week_index,
             cohort_size,
             active_users,
             retention_rate
-        FROM analytics.fact_weekly_cohort_retention;
+        FROM analytics.fact_weekly_cohort_retention
+        """,
+        "cohort_week, week_index",
+    ),
+    "vw_ltv_cac_ratio": (
         """
-    )
-    
-    con.execute("DROP VIEW IF EXISTS analytics.vw_ltv_cac_ratio;")
-    con.execute(
-        """
-        CREATE VIEW analytics.vw_ltv_cac_ratio AS
-        SELECT * FROM analytics.fact_ltv_cac_ratio;
-        """
-    )
+        SELECT * FROM analytics.fact_ltv_cac_ratio
+        """,
+        None,
+    ),
+}
+
+
+def table_name(view: str) -> str:
+    return "mv_" + view.removeprefix("vw_")
+
+
+def _create_table(con, view: str, name: str, staged: list[str] = ()):
+    sql, order_by = VIEWS[view]
+    # the joins read the facts and dims staged for this build, so the view matches what is swapped in
+    sql = re.sub(r"analytics\.(\w+)", lambda m: f"analytics.{db.staging_name(m[1]) if m[1] in staged else m[1]}", sql)
+    order = f"ORDER BY {order_by}" if order_by else ""
+    con.execute(f"CREATE OR REPLACE TABLE analytics.{name} AS {sql} {order};")
+
+
+def main():
+    # the publish step of the gold build: in staged mode the facts and dims the loader and build_dims
+    # left under their staging names are swapped in with the materialized views in one transaction,
+    # under one build version
+    materialized = VIEWS_MODE == "materialized"
+    staged = db.PUBLISH_MODE == "staged"
+    con = get_conn()
+    try:
+        con.execute("CREATE SCHEMA IF NOT EXISTS analytics;")
+        views = {table_name(v) for v in VIEWS}
+        pending = [t for t in db.staged_tables(con, "analytics") if t not in views] if staged else []
+        for t in views:
+            con.execute(f"DROP TABLE IF EXISTS analytics.{db.staging_name(t)};")
+        if materialized and staged:
+            # the joins run outside the publish transaction, under names no reader queries
+            for view in VIEWS:
+                _create_table(con, view, db.staging_name(table_name(view)), pending)
 
-    con.close()
-    logger.info("DONE building analytics views")
+        con.execute("BEGIN TRANSACTION;")
+        try:
+            for t in pending:
+                db.swap(con, "analytics", t)
+            for view, (sql, _) in VIEWS.items():
+                if materialized and staged:
+                    db.swap(con, "analytics", table_name(view))
+                elif materialized:
+                    _create_table(con, view, table_name(view))
+                if materialized:
+                    sql = f"SELECT * FROM analytics.{table_name(view)}"
+                else:
+                    con.execute(f"DROP TABLE IF EXISTS analytics.{table_name(view)};")
+                con.execute(f"CREATE OR REPLACE VIEW analytics.{view} AS {sql};")
+            db.bump_build_version(con)
+            con.execute("COMMIT;")
+        except Exception:
+            con.execute("ROLLBACK;")
+            raise
+    finally:
+        con.close()
+        db.close()
+    query_service.invalidate()
+    logger.info(f"DONE building analytics views mode={VIEWS_MODE} publish={db.PUBLISH_MODE} swapped={pending}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
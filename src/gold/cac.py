@@ -1,34 +1,28 @@
 import pandas as pd
 
+from src.common import silver_cache
+from src.common.kpi_math import safe_divide
 from src.common.logger import get_logger
-from src.common.paths import GOLD_DIR, SILVER_DIR
+from src.common.paths import GOLD_DIR
+from src.gold.sql_backend import backend_for, marketing_source, query_df, strip_sql, user_daily_cte, valid_user_sql
 
 logger = get_logger("gold_cac")
 
+# user-days with a signup (for the channel) or a purchase (for the converters)
+COLUMNS = ["user_key", "n_purchase", "signup_channel", "signup_channel_ts"]
+FILTERS = [[("n_signup", ">", 0)], [("n_purchase", ">", 0)]]
+MARKETING_COLUMNS = ["channel", "spend"]
 
-def main():
-    GOLD_DIR.mkdir(parents=True, exist_ok=True)
-
-    events = pd.read_parquet(SILVER_DIR / "events_clean.parquet")
-    mkt = pd.read_parquet(SILVER_DIR / "marketing_spend_clean.parquet")
-
-    logger.info(f"Read events rows={len(events)}")
-    logger.info(f"Read marketing rows={len(mkt)}")
 
-    # normalize
-    events["event_type"] = events["event_type"].astype(str).str.strip().str.lower()
-    events["user_id"] = events["user_id"].astype(str).str.strip()
-    events["acquisition_channel"] = events["acquisition_channel"].astype(str).str.strip()
-
-    # user -> channel from earliest signup
-    signups = events[events["event_type"] == "signup"].copy()
-    signups = signups[~signups["user_id"].str.lower().isin(["", "none", "nan"])]
-    signups = signups.dropna(subset=["event_ts_utc"])
+def cac_by_channel(user_daily: pd.DataFrame, mkt: pd.DataFrame) -> pd.DataFrame:
+    # user -> channel from earliest signup (silver keeps each day's first signup that named one)
+    signups = user_daily.dropna(subset=["user_key", "signup_channel_ts"])
 
     signup_first = (
-        signups.sort_values("event_ts_utc")
-        .groupby("user_id", as_index=False)
-        .first()[["user_id", "acquisition_channel"]]
+        signups.sort_values("signup_channel_ts")
+        .groupby("user_key", as_index=False)
+        .first()[["user_key", "signup_channel"]]
+        .rename(columns={"signup_channel": "acquisition_channel"})
     )
 
     # clean channel names
@@ -37,17 +31,17 @@ def main():
     )
 
     # paid converters = users with at least one purchase
-    purchases = events[events["event_type"] == "purchase"].copy()
-    purchases = purchases[~purchases["user_id"].str.lower().isin(["", "none", "nan"])]
+    purchases = user_daily[user_daily["n_purchase"] > 0]
+    purchases = purchases.dropna(subset=["user_key"])
 
-    converters = purchases[["user_id"]].drop_duplicates()
-    converters = converters.merge(signup_first, on="user_id", how="left")
+    converters = purchases[["user_key"]].drop_duplicates()
+    converters = converters.merge(signup_first, on="user_key", how="left")
     converters["acquisition_channel"] = converters["acquisition_channel"].fillna("Unknown")
 
     conversions_by_channel = (
-        converters.groupby("acquisition_channel", as_index=False)["user_id"]
+        converters.groupby("acquisition_channel", as_index=False)["user_key"]
         .nunique()
-        .rename(columns={"user_id": "paid_conversions"})
+        .rename(columns={"user_key": "paid_conversions"})
         .rename(columns={"acquisition_channel": "channel"})
     )
 
@@ -64,12 +58,71 @@ def main():
     # CAC = spend / conversions
     out = spend_by_channel.merge(conversions_by_channel, on="channel", how="left")
     out["paid_conversions"] = out["paid_conversions"].fillna(0).astype(int)
-    out["cac"] = out.apply(
-        lambda r: (r["total_spend"] / r["paid_conversions"]) if r["paid_conversions"] > 0 else None,
-        axis=1,
-    )
+    out["cac"] = safe_divide(out["total_spend"], out["paid_conversions"])
 
     out = out.sort_values("total_spend", ascending=False)
+    return out
+
+
+def cac_by_channel_sql() -> pd.DataFrame:
+    sql = f"""
+    WITH {user_daily_cte()},
+    signup_first AS (
+        -- user -> channel from earliest signup that named one (silver keeps one per day)
+        SELECT user_key, arg_min(signup_channel, signup_channel_ts) AS acquisition_channel
+        FROM user_daily
+        WHERE {valid_user_sql()} AND signup_channel_ts IS NOT NULL
+        GROUP BY user_key
+    ),
+    converters AS (
+        SELECT DISTINCT user_key
+        FROM user_daily
+        WHERE n_purchase > 0 AND {valid_user_sql()}
+    ),
+    conversions_by_channel AS (
+        SELECT
+            CASE
+                WHEN s.acquisition_channel IS NULL OR s.acquisition_channel IN ('', 'none', 'nan') THEN 'Unknown'
+                ELSE s.acquisition_channel
+            END AS channel,
+            COUNT(DISTINCT c.user_key) AS paid_conversions
+        FROM converters c
+        LEFT JOIN signup_first s ON s.user_key = c.user_key
+        GROUP BY 1
+    ),
+    spend_by_channel AS (
+        SELECT
+            {strip_sql("channel")} AS channel,
+            SUM(COALESCE(TRY_CAST(spend AS DOUBLE), 0)) AS total_spend
+        FROM {marketing_source()}
+        GROUP BY 1
+    )
+    SELECT
+        s.channel,
+        s.total_spend,
+        COALESCE(c.paid_conversions, 0) AS paid_conversions,
+        CASE WHEN COALESCE(c.paid_conversions, 0) > 0 THEN s.total_spend / c.paid_conversions END AS cac
+    FROM spend_by_channel s
+    LEFT JOIN conversions_by_channel c ON c.channel = s.channel
+    ORDER BY s.total_spend DESC
+    """
+    return query_df(sql)
+
+
+def main():
+    GOLD_DIR.mkdir(parents=True, exist_ok=True)
+
+    if backend_for("cac") == "duckdb":
+        logger.info("Computing CAC in DuckDB")
+        out = cac_by_channel_sql()
+    else:
+        user_daily = silver_cache.user_daily(columns=COLUMNS, filters=FILTERS)
+        mkt = silver_cache.marketing(MARKETING_COLUMNS)
+
+        logger.info(f"Read user_daily rows={len(user_daily)}")
+        logger.info(f"Read marketing rows={len(mkt)}")
+
+        out = cac_by_channel(user_daily, mkt)
 
     out_path = GOLD_DIR / "cac_by_channel.parquet"
     out.to_parquet(out_path, index=False)
@@ -1,74 +1,185 @@
+import shutil
+
 import pandas as pd
+import pyarrow.parquet as pq
 
+from src.common import hll, silver_cache
+from src.common.datasets import list_partitions, read, read_partitioned, write_partition
 from src.common.logger import get_logger
-from src.common.paths import GOLD_DIR, SILVER_DIR
+from src.common.paths import GOLD_DIR, SILVER_USER_DAILY_DIR, STATE_DIR
+from src.gold import date_scope
 
 logger = get_logger("gold_retention")
 
+# "active events" for retention means the following!
+ACTIVE_COUNTS = ["n_login", "n_page_view", "n_purchase", "n_trial_start", "n_trial_convert"]
+
+# user-days that signed up or were active
+COLUMNS = ["event_date", "user_key", "first_signup_ts"] + ACTIVE_COUNTS
+FILTERS = [[(c, ">", 0)] for c in ["n_signup"] + ACTIVE_COUNTS]
+
+# per-week state, so an incremental run only refolds the weeks that received events:
+# distinct (activity_week, user_key) pairs and the earliest signup per (week, user_key)
+ACTIVITY_STATE_DIR = STATE_DIR / "retention_activity_weeks"
+SIGNUP_STATE_DIR = STATE_DIR / "retention_signup_weeks"
+
+OUT_PATH = GOLD_DIR / "weekly_cohort_retention.parquet"
+
 
 def week_start_monday(ts: pd.Series) -> pd.Series:
-    
+
     dt = pd.to_datetime(ts, errors="coerce")
     return (dt - pd.to_timedelta(dt.dt.weekday, unit="D")).dt.normalize()
 
 
-def main():
-    GOLD_DIR.mkdir(parents=True, exist_ok=True)
+def _week_of(date_str: str) -> str:
+    d = pd.Timestamp(date_str)
+    return (d - pd.Timedelta(days=d.weekday())).strftime("%Y-%m-%d")
 
-    events_path = SILVER_DIR / "events_clean.parquet"
-    df = pd.read_parquet(events_path)
-    logger.info(f"Read events: path={events_path} rows={len(df)}")
 
-    # Basic cleaning
-    df["event_type"] = df["event_type"].astype(str).str.strip().str.lower()
-    df["user_id"] = df["user_id"].astype(str).str.strip()
-    df = df[~df["user_id"].str.lower().isin(["", "none", "nan"])].copy()
+def _fold_weeks(user_daily: pd.DataFrame, weeks: list[str]):
+    # user_daily holds every day of `weeks`; their state partitions are replaced, not appended to,
+    # so events that moved to another day are also removed
+    df = user_daily.dropna(subset=["user_key", "event_date"])
 
-    # finding signup timestamp per user 
-    signups = df[df["event_type"] == "signup"].copy()
-    signups = signups.dropna(subset=["event_ts_utc"])
-    signup_per_user = (
-        signups.groupby("user_id", as_index=False)["event_ts_utc"]
+    signups = df.dropna(subset=["first_signup_ts"]).copy()
+    signups["week"] = week_start_monday(signups["first_signup_ts"])
+    signup_weeks = (
+        signups.groupby(["week", "user_key"], as_index=False)["first_signup_ts"]
         .min()
-        .rename(columns={"event_ts_utc": "signup_ts"})
+        .rename(columns={"first_signup_ts": "signup_ts"})
     )
-    signup_per_user["cohort_week"] = week_start_monday(signup_per_user["signup_ts"])
 
-    cohort_sizes = (
-        signup_per_user.groupby("cohort_week", as_index=False)["user_id"]
-        .nunique()
-        .rename(columns={"user_id": "cohort_size"})
-    )
+    activity = df[df[ACTIVE_COUNTS].sum(axis=1).gt(0)].copy()
+    activity["activity_week"] = week_start_monday(activity["event_date"])
+    activity_weeks = activity[["activity_week", "user_key"]].drop_duplicates()
 
-    logger.info(f"Signup users: {len(signup_per_user)} cohorts: {len(cohort_sizes)}")
+    signup_parts = dict(tuple(signup_weeks.groupby(signup_weeks["week"].dt.strftime("%Y-%m-%d"))))
+    activity_parts = dict(tuple(activity_weeks.groupby(activity_weeks["activity_week"].dt.strftime("%Y-%m-%d"))))
+    for w in weeks:
+        write_partition(signup_parts.get(w, signup_weeks.iloc[:0]), SIGNUP_STATE_DIR, "week", w)
+        write_partition(activity_parts.get(w, activity_weeks.iloc[:0]), ACTIVITY_STATE_DIR, "week", w)
 
-    # "active events" for retention means the following!
-    active_types = {"login", "page_view", "purchase", "trial_start", "trial_convert"}
 
-    activity = df[df["event_type"].isin(active_types)].copy()
-    activity = activity.dropna(subset=["event_ts_utc"])
-    activity["activity_week"] = week_start_monday(activity["event_ts_utc"])
+def _signup_per_user() -> pd.DataFrame:
+    signup_weeks = read_partitioned(SIGNUP_STATE_DIR, "week")
+    if signup_weeks.empty:
+        return pd.DataFrame({"user_key": pd.Series(dtype="Int64"), "signup_ts": pd.Series(dtype="datetime64[us]"),
+                             "cohort_week": pd.Series(dtype="datetime64[us]")})
+    signup_per_user = signup_weeks.groupby("user_key", as_index=False)["signup_ts"].min()
+    signup_per_user["cohort_week"] = week_start_monday(signup_per_user["signup_ts"])
+    return signup_per_user
 
-    activity = activity.merge(signup_per_user[["user_id", "cohort_week"]], on="user_id", how="inner")
+
+def _cells(activity_weeks: pd.DataFrame, signup_per_user: pd.DataFrame) -> pd.DataFrame:
+    activity = activity_weeks.merge(signup_per_user[["user_key", "cohort_week"]], on="user_key", how="inner")
 
     activity["week_index"] = ((activity["activity_week"] - activity["cohort_week"]).dt.days // 7).astype(int)
 
     activity = activity[activity["week_index"] >= 0].copy()
 
-    active_counts = (
-        activity.groupby(["cohort_week", "week_index"], as_index=False)["user_id"]
+    keys = ["cohort_week", "week_index"]
+    out = None
+    if hll.exact_enabled():
+        out = (
+            activity.groupby(keys, as_index=False)["user_key"]
+            .nunique()
+            .rename(columns={"user_key": "active_users"})
+        )
+    if hll.approx_enabled():
+        approx, registers = hll.sketch_groups(activity[keys], activity["user_key"])
+        approx["active_users_approx"] = hll.estimate(registers) if len(approx) else pd.Series(dtype="int64")
+        if out is None:
+            out = approx.rename(columns={"active_users_approx": "active_users"})
+        else:
+            out = out.merge(approx, on=keys, how="left")
+    return out
+
+
+def _with_rates(active_counts: pd.DataFrame, signup_per_user: pd.DataFrame) -> pd.DataFrame:
+    cohort_sizes = (
+        signup_per_user.groupby("cohort_week", as_index=False)["user_key"]
         .nunique()
-        .rename(columns={"user_id": "active_users"})
-        .sort_values(["cohort_week", "week_index"])
+        .rename(columns={"user_key": "cohort_size"})
     )
+    logger.info(f"Signup users: {len(signup_per_user)} cohorts: {len(cohort_sizes)}")
 
-    out = active_counts.merge(cohort_sizes, on="cohort_week", how="left")
+    out = active_counts.sort_values(["cohort_week", "week_index"]).merge(cohort_sizes, on="cohort_week", how="left")
     out["retention_rate"] = out["active_users"] / out["cohort_size"]
+    if "active_users_approx" in out.columns:
+        out["retention_rate_approx"] = out["active_users_approx"] / out["cohort_size"]
+    return out
+
+
+def _rebuild() -> pd.DataFrame:
+    shutil.rmtree(ACTIVITY_STATE_DIR, ignore_errors=True)
+    shutil.rmtree(SIGNUP_STATE_DIR, ignore_errors=True)
+
+    df = silver_cache.user_daily(columns=COLUMNS, filters=FILTERS)
+    logger.info(f"Read user_daily: rows={len(df)}")
+    weeks = sorted(week_start_monday(df["event_date"]).dropna().dt.strftime("%Y-%m-%d").unique().tolist())
+    _fold_weeks(df, weeks)
+
+    signup_per_user = _signup_per_user()
+    active_counts = _cells(read_partitioned(ACTIVITY_STATE_DIR, "week"), signup_per_user)
+    return _with_rates(active_counts, signup_per_user)
+
+
+def _update(dates: list[str]) -> pd.DataFrame:
+    weeks = sorted({_week_of(d) for d in dates})
+    # refold whole weeks: a week's state is rebuilt from all of its days, old and new
+    week_dates = [d for d in list_partitions(SILVER_USER_DAILY_DIR, "event_date") if _week_of(d) in weeks]
+    df = silver_cache.user_daily(week_dates, COLUMNS, FILTERS)
+    logger.info(f"Read user_daily: rows={len(df)} weeks={len(weeks)}")
+
+    old_signups = _signup_per_user()
+    _fold_weeks(df, weeks)
+    signup_per_user = _signup_per_user()
+
+    # users whose cohort appeared, disappeared or moved change every cell of both cohorts
+    both = old_signups.merge(signup_per_user, on="user_key", how="outer", suffixes=("_old", ""))
+    changed = both[both["cohort_week_old"].ne(both["cohort_week"])
+                   & ~(both["cohort_week_old"].isna() & both["cohort_week"].isna())]
+    cohorts = set(changed["cohort_week_old"].dropna()) | set(changed["cohort_week"].dropna())
+    week_ts = {pd.Timestamp(w) for w in weeks}
+
+    # cells of a changed cohort only have activity weeks from that cohort on
+    read_weeks = set(weeks)
+    if cohorts:
+        first = min(cohorts).strftime("%Y-%m-%d")
+        read_weeks |= {w for w in list_partitions(ACTIVITY_STATE_DIR, "week") if w >= first}
+    active_counts = _cells(read_partitioned(ACTIVITY_STATE_DIR, "week", sorted(read_weeks)), signup_per_user)
+
+    def affected(cells: pd.DataFrame) -> pd.Series:
+        activity_week = cells["cohort_week"] + pd.to_timedelta(cells["week_index"] * 7, unit="D")
+        return cells["cohort_week"].isin(cohorts) | activity_week.isin(week_ts)
+
+    active_counts = active_counts[affected(active_counts)]
+    previous = read([OUT_PATH], list(active_counts.columns))
+    kept = previous[~affected(previous)]
+    logger.info(f"Retention cells recomputed: {len(active_counts)} kept: {len(kept)} changed cohorts: {len(cohorts)}")
+    return _with_rates(pd.concat([kept, active_counts], ignore_index=True), signup_per_user)
+
+
+def main(incremental: bool = False):
+    GOLD_DIR.mkdir(parents=True, exist_ok=True)
+
+    dates = date_scope.event_dates(incremental) if incremental else None
+    if dates is not None and not dates:
+        logger.info("Gold retention skipped: no new event dates")
+        return
+
+    # a switch of GOLD_DISTINCT_MODE changes the cell columns, so the matrix is rebuilt
+    cell_cols = {"active_users"} | ({"active_users_approx"} if hll.DISTINCT_MODE == "both" else set())
+    if (dates is None or not OUT_PATH.exists() or not ACTIVITY_STATE_DIR.exists()
+            or {c for c in pq.read_schema(OUT_PATH).names if c.startswith("active_users")} != cell_cols):
+        out = _rebuild()
+    else:
+        out = _update(dates)
 
-    out_path = GOLD_DIR / "weekly_cohort_retention.parquet"
-    out.to_parquet(out_path, index=False)
-    logger.info(f"Wrote: {out_path} rows={len(out)}")
+    out.to_parquet(OUT_PATH, index=False)
+    logger.info(f"Wrote: {OUT_PATH} rows={len(out)}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,22 @@
+import os
+
+from src.common import watermarks
+from src.common.datasets import list_partitions
+from src.common.paths import SILVER_EVENTS_DIR
+
+# backfill window (inclusive, YYYY-MM-DD) for the date-local gold facts of a full run;
+# unset means the whole history
+DATE_FROM = os.getenv("GOLD_DATE_FROM")
+DATE_TO = os.getenv("GOLD_DATE_TO")
+
+
+def event_dates(incremental: bool = False) -> list[str] | None:
+    # None = every date; otherwise only these event_date partitions are read and rewritten
+    if incremental:
+        return watermarks.get_dirty_dates("events")
+    if DATE_FROM is None and DATE_TO is None:
+        return None
+    return [
+        d for d in list_partitions(SILVER_EVENTS_DIR, "event_date")
+        if (DATE_FROM is None or d >= DATE_FROM) and (DATE_TO is None or d <= DATE_TO)
+    ]
@@ -1,6 +1,13 @@
+import datetime
+
+import pyarrow as pa
+
 from src.common.logger import get_logger
+from src.common import db, query_service
+from src.common.datasets import read_table
 from src.common.db import get_conn
 from src.common.paths import GOLD_DIR
+from src.gold import date_scope
 
 logger = get_logger("gold_duckdb_loader")
 
@@ -15,28 +22,130 @@ GOLD_TABLES = [
     ("fact_ltv_cac_ratio", "ltv_cac_ratio.parquet"),
 ]
 
+# only written in GOLD_DISTINCT_MODE=approx|both, loaded when present
+OPTIONAL_TABLES = [
+    ("fact_active_users_rollup", "active_users_rollup.parquet"),
+]
 
-def main():
-    con = get_conn()
-    con.execute("CREATE SCHEMA IF NOT EXISTS analytics;")
+# daily facts metrics_basic rewrites per event_date; on incremental/backfill runs only those dates reload
+DATE_TABLES = {
+    "fact_daily_active_users": "event_date",
+    "fact_daily_revenue_gross": "event_date",
+    "fact_daily_revenue_net": "event_date",
+}
+
+
+def _date_filter(col: str, dates: list[str]) -> str:
+    # the BETWEEN lets DuckDB skip Parquet row groups by their min/max before the IN is checked
+    date_list = ", ".join(f"DATE '{d}'" for d in dates)
+    return f"{col} BETWEEN DATE '{min(dates)}' AND DATE '{max(dates)}' AND {col} IN ({date_list})"
+
+
+def _read_dates(path: str, col: str, dates: list[str]) -> pa.Table:
+    # only the recomputed days leave the file; row groups outside them are skipped by their stats
+    wanted = [datetime.date.fromisoformat(d) for d in dates]
+    return read_table([path], filters=[(col, "in", wanted)])
+
+
+def _reload_dates(con, table_name: str, col: str, dates: list[str], arrow: pa.Table):
+    con.execute(f"DELETE FROM analytics.{table_name} WHERE {_date_filter(col, dates)};")
+    con.register("gold_arrow", arrow)
+    con.execute(f"INSERT INTO analytics.{table_name} SELECT * FROM gold_arrow;")
+    con.unregister("gold_arrow")
 
-    for table_name, file_name in GOLD_TABLES:
+
+def _stage_dates(con, table_name: str, col: str, dates: list[str], arrow: pa.Table):
+    # the staged copy: the live table's other days plus the recomputed ones
+    con.register("gold_arrow", arrow)
+    con.execute(
+        f"""
+        CREATE OR REPLACE TABLE analytics.{db.staging_name(table_name)} AS
+        SELECT * FROM analytics.{table_name} WHERE {col} IS NULL OR NOT ({_date_filter(col, dates)})
+        UNION ALL
+        SELECT * FROM gold_arrow;
+        """
+    )
+    con.unregister("gold_arrow")
+
+
+def _create(con, table_name: str, arrow: pa.Table):
+    # register() scans the Arrow buffers in place, no pandas or Parquet round trip
+    con.register("gold_arrow", arrow)
+    con.execute(f"CREATE OR REPLACE TABLE analytics.{table_name} AS SELECT * FROM gold_arrow;")
+    con.unregister("gold_arrow")
+
+
+def main(incremental: bool = False, publish: bool = True):
+    dates = date_scope.event_dates(incremental)
+    staged = db.PUBLISH_MODE == "staged"
+    existing = db.analytics_tables() if dates is not None else set()
+
+    # the Parquet is read before the write lock is taken
+    optional = [(t, f) for t, f in OPTIONAL_TABLES if (GOLD_DIR / f).exists()]
+    reloads, replaced = [], []
+    for table_name, file_name in GOLD_TABLES + optional:
         path = (GOLD_DIR / file_name).as_posix()
 
-        con.execute(f"DROP TABLE IF EXISTS analytics.{table_name};")
-        con.execute(
-            f"""
-            CREATE TABLE analytics.{table_name} AS
-            SELECT * FROM read_parquet('{path}');
-            """
-        )
+        date_col = DATE_TABLES.get(table_name)
+        if dates is not None and date_col and table_name in existing:
+            if not dates:
+                logger.info(f"Kept table=analytics.{table_name}: no dates to reload")
+                continue
+            reloads.append((table_name, date_col, _read_dates(path, date_col, dates), path))
+            continue
+
+        replaced.append((table_name, read_table([path]), path))
+
+    con = get_conn()
+    try:
+        con.execute("CREATE SCHEMA IF NOT EXISTS analytics;")
+        if staged:
+            # the slow part runs outside the publish transaction, under names no reader queries; a staged
+            # copy left by a failed earlier run is dropped first, so it never reaches a publish
+            for table_name, _ in GOLD_TABLES + OPTIONAL_TABLES:
+                con.execute(f"DROP TABLE IF EXISTS analytics.{db.staging_name(table_name)};")
+            for table_name, date_col, arrow, _ in reloads:
+                _stage_dates(con, table_name, date_col, dates, arrow)
+            for table_name, arrow, _ in replaced:
+                _create(con, db.staging_name(table_name), arrow)
 
-        cnt = con.execute(f"SELECT COUNT(*) FROM analytics.{table_name};").fetchone()[0]
-        logger.info(f"Loaded table=analytics.{table_name} rows={cnt} source={path}")
+        # staged and not publishing: the views step swaps these in. Direct mode writes in place, so its
+        # tables are live at this COMMIT even when the build version is bumped later
+        if publish or not staged:
+            # one transaction: readers see either the previous load or this one, never a mix
+            con.execute("BEGIN TRANSACTION;")
+            try:
+                if staged:
+                    for table_name in [r[0] for r in reloads] + [r[0] for r in replaced]:
+                        db.swap(con, "analytics", table_name)
+                else:
+                    for table_name, date_col, arrow, _ in reloads:
+                        _reload_dates(con, table_name, date_col, dates, arrow)
+                    for table_name, arrow, _ in replaced:
+                        _create(con, table_name, arrow)
+                if publish:
+                    db.bump_build_version(con)
+                con.execute("COMMIT;")
+            except Exception:
+                con.execute("ROLLBACK;")
+                raise
+    finally:
+        con.close()
+        # the write lock is released as soon as the load is written
+        db.close()
 
-    con.close()
-    logger.info("DONE loading gold parquet -> duckdb")
+    for table_name, _, arrow, path in reloads:
+        logger.info(f"Reloaded table=analytics.{table_name} dates={len(dates)} rows={arrow.num_rows} source={path}")
+    for table_name, arrow, path in replaced:
+        logger.info(f"Loaded table=analytics.{table_name} rows={arrow.num_rows} source={path}")
+    if not publish:
+        # gold_build_views publishes the build: one version for the facts, dims and materialized views
+        logger.info(f"DONE loading gold parquet -> duckdb publish={db.PUBLISH_MODE}, awaiting the views step")
+        return
+    # cached query results belong to the previous build
+    query_service.invalidate()
+    logger.info(f"DONE loading gold parquet -> duckdb publish={db.PUBLISH_MODE}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
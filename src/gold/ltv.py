@@ -1,39 +1,60 @@
 import pandas as pd
 
+from src.common import silver_cache
 from src.common.logger import get_logger
-from src.common.paths import GOLD_DIR, SILVER_DIR
+from src.common.paths import GOLD_DIR
+from src.gold.sql_backend import backend_for, query_df, user_daily_cte, valid_user_sql
 
 logger = get_logger("gold_ltv")
 
+# user-days with a purchase or refund, and only the columns LTV sums
+COLUMNS = ["user_key", "n_purchase", "n_refund", "purchase_amount", "refund_amount"]
+FILTERS = [[("n_purchase", ">", 0)], [("n_refund", ">", 0)]]
 
-def main():
-    GOLD_DIR.mkdir(parents=True, exist_ok=True)
-
-    events_path = SILVER_DIR / "events_clean.parquet"
-    df = pd.read_parquet(events_path)
-    logger.info(f"Read events: path={events_path} rows={len(df)}")
-
-    df["event_type"] = df["event_type"].astype(str).str.strip().str.lower()
-    df["user_id"] = df["user_id"].astype(str).str.strip()
-    df = df[~df["user_id"].str.lower().isin(["", "none", "nan"])].copy()
 
-    # Keep only purchase/refund
-    df = df[df["event_type"].isin(["purchase", "refund"])].copy()
+def ltv_per_user(user_daily: pd.DataFrame) -> pd.DataFrame:
+    df = user_daily.dropna(subset=["user_key"])
 
-    df["amount_num"] = pd.to_numeric(df["amount_num"], errors="coerce").fillna(0)
+    # Keep only days with a purchase/refund
+    df = df[(df["n_purchase"] + df["n_refund"]) > 0].copy()
 
     # purchase = +amount, refund = -abs(amount)
-    df["signed_amount"] = df.apply(
-        lambda r: r["amount_num"] if r["event_type"] == "purchase" else -abs(r["amount_num"]),
-        axis=1,
-    )
+    df["signed_amount"] = df["purchase_amount"] - df["refund_amount"]
 
     ltv = (
-        df.groupby("user_id", as_index=False)["signed_amount"]
+        df.groupby("user_key", as_index=False)["signed_amount"]
         .sum()
         .rename(columns={"signed_amount": "ltv"})
         .sort_values("ltv", ascending=False)
     )
+    return ltv
+
+
+def ltv_per_user_sql() -> pd.DataFrame:
+    # purchase = +amount, refund = -abs(amount)
+    sql = f"""
+    WITH {user_daily_cte()}
+    SELECT
+        user_key,
+        SUM(purchase_amount - refund_amount) AS ltv
+    FROM user_daily
+    WHERE n_purchase + n_refund > 0 AND {valid_user_sql()}
+    GROUP BY user_key
+    ORDER BY ltv DESC, user_key
+    """
+    return query_df(sql)
+
+
+def main():
+    GOLD_DIR.mkdir(parents=True, exist_ok=True)
+
+    if backend_for("ltv") == "duckdb":
+        logger.info("Computing LTV in DuckDB")
+        ltv = ltv_per_user_sql()
+    else:
+        df = silver_cache.user_daily(columns=COLUMNS, filters=FILTERS)
+        logger.info(f"Read user_daily: rows={len(df)}")
+        ltv = ltv_per_user(df)
 
     out_path = GOLD_DIR / "ltv_per_user.parquet"
     ltv.to_parquet(out_path, index=False)
@@ -1,7 +1,9 @@
 import pandas as pd
 
+from src.common import silver_cache
+from src.common.datasets import read
 from src.common.logger import get_logger
-from src.common.paths import GOLD_DIR, SILVER_DIR
+from src.common.paths import GOLD_DIR
 
 logger = get_logger("gold_ltv_cac")
 
@@ -10,24 +12,19 @@ def main():
     GOLD_DIR.mkdir(parents=True, exist_ok=True)
 
     # total LTV from ltv_per_user
-    ltv_df = pd.read_parquet(GOLD_DIR / "ltv_per_user.parquet")
+    ltv_df = read([GOLD_DIR / "ltv_per_user.parquet"], ["ltv"])
     ltv_df["ltv"] = pd.to_numeric(ltv_df["ltv"], errors="coerce").fillna(0)
     total_ltv = float(ltv_df["ltv"].sum())
 
     # total spend from marketing
-    mkt = pd.read_parquet(SILVER_DIR / "marketing_spend_clean.parquet")
+    mkt = silver_cache.marketing(["spend"])
     mkt["spend"] = pd.to_numeric(mkt["spend"], errors="coerce").fillna(0)
     
     total_spend = float(mkt["spend"].sum())
 
     # paid conversions = unique users with at least one purchase
-    events = pd.read_parquet(SILVER_DIR / "events_clean.parquet")
-    events["event_type"] = events["event_type"].astype(str).str.strip().str.lower()
-    events["user_id"] = events["user_id"].astype(str).str.strip()
-    events = events[~events["user_id"].str.lower().isin(["", "none", "nan"])].copy()
-
-    purchases = events[events["event_type"] == "purchase"]
-    paid_conversions = int(purchases["user_id"].nunique())
+    purchases = silver_cache.user_daily(columns=["user_key"], filters=[("n_purchase", ">", 0)])
+    paid_conversions = int(purchases["user_key"].nunique())
 
     # CAC overall
     cac_overall = (total_spend / paid_conversions) if paid_conversions > 0 else None
@@ -1,73 +1,105 @@
+import datetime
+
 import pandas as pd
 
+from src.common import hll, silver_cache
+from src.common.datasets import read
 from src.common.logger import get_logger
-from src.common.paths import GOLD_DIR, SILVER_DIR
+from src.common.paths import GOLD_DIR
+from src.gold import date_scope
+from src.gold.sql_backend import backend_for, query_df, user_daily_cte, valid_user_sql
 
 logger = get_logger("gold_basic")
 
+SKETCH_PATH = GOLD_DIR / "dau_sketches.parquet"
+ROLLUP_PATH = GOLD_DIR / "active_users_rollup.parquet"
+
+# "active user" means the following!
+ACTIVE_COUNTS = ["n_login", "n_page_view", "n_purchase"]
 
-def _clean_user_id(s: pd.Series) -> pd.Series:
-    
-    s = s.astype(str).str.strip()
-    return s[~s.str.lower().isin(["", "none", "nan"])]
+# what DAU, sketches and revenue read from silver user_daily: days with activity or a refund
+COLUMNS = ["event_date", "user_key", "n_login", "n_page_view", "n_purchase", "n_refund",
+           "purchase_amount", "refund_amount"]
+FILTERS = [[(c, ">", 0)] for c in ACTIVE_COUNTS + ["n_refund"]]
 
 
-def daily_active_users(events: pd.DataFrame) -> pd.DataFrame:
-    df = events.copy()
+def _active_rows(user_daily: pd.DataFrame) -> pd.DataFrame:
+    return user_daily[user_daily[ACTIVE_COUNTS].sum(axis=1).gt(0) & user_daily["user_key"].notna()]
 
-    
-    df["event_date"] = pd.to_datetime(df["event_ts_utc"]).dt.date
-    df["event_type"] = df["event_type"].astype(str).str.strip().str.lower()
 
-    # "active user" means the following!
-    active_types = {"login", "page_view", "purchase"}
+def _as_dates(df: pd.DataFrame) -> pd.DataFrame:
+    df["event_date"] = df["event_date"].dt.date
+    return df
 
-    df = df[df["event_type"].isin(active_types)].copy()
-    df = df[df["user_id"].notna()].copy()
-    df["user_id"] = df["user_id"].astype(str).str.strip()
-    df = df[~df["user_id"].str.lower().isin(["", "none", "nan"])]
+
+def daily_active_users(user_daily: pd.DataFrame) -> pd.DataFrame:
+    df = _active_rows(user_daily)
 
     out = (
-        df.groupby("event_date", as_index=False)["user_id"]
+        df.groupby("event_date", as_index=False)["user_key"]
         .nunique()
-        .rename(columns={"user_id": "daily_active_users"})
+        .rename(columns={"user_key": "daily_active_users"})
         .sort_values("event_date")
     )
+    return _as_dates(out)
+
+
+def daily_active_user_sketches(user_daily: pd.DataFrame) -> pd.DataFrame:
+    # one HyperLogLog sketch per day; merged by week / month for WAU and MAU
+    df = _active_rows(user_daily)
+    out, registers = hll.sketch_groups(df[["event_date"]], df["user_key"])
+    out = _as_dates(out)
+    out["precision"] = hll.PRECISION
+    out["sketch"] = hll.to_bytes(registers)
     return out
 
 
-def daily_revenue_gross(events: pd.DataFrame) -> pd.DataFrame:
-    df = events.copy()
-    df["event_date"] = pd.to_datetime(df["event_ts_utc"]).dt.date
-    df["event_type"] = df["event_type"].astype(str).str.strip().str.lower()
+def approx_daily_active_users(sketches: pd.DataFrame) -> pd.DataFrame:
+    out = sketches[["event_date"]].copy()
+    out["daily_active_users_approx"] = hll.estimate(hll.from_bytes(sketches["sketch"])) if len(sketches) else []
+    return out
 
-    purchases = df[df["event_type"] == "purchase"].copy()
 
-    
-    purchases["amount_num"] = pd.to_numeric(purchases["amount_num"], errors="coerce").fillna(0)
+def active_users_rollup(sketches: pd.DataFrame) -> pd.DataFrame:
+    # WAU / MAU straight from the stored daily sketches, no event is read again
+    if sketches["precision"].nunique() > 1:
+        raise ValueError("dau_sketches.parquet mixes HLL precisions; run a full rebuild")
+    rows = []
+    if len(sketches):
+        registers = hll.from_bytes(sketches["sketch"])
+        days = pd.to_datetime(sketches["event_date"]).reset_index(drop=True)
+        periods = {
+            "week": days - pd.to_timedelta(days.dt.weekday, unit="D"),
+            "month": days.dt.to_period("M").dt.start_time,
+        }
+        for grain, starts in periods.items():
+            for start, pos in starts.groupby(starts).indices.items():
+                rows.append({
+                    "grain": grain,
+                    "period_start": start.date(),
+                    "days": len(pos),
+                    "active_users_approx": int(hll.estimate(hll.merge(registers[pos]))[0]),
+                })
+    return pd.DataFrame(rows, columns=["grain", "period_start", "days", "active_users_approx"])
+
+
+def daily_revenue_gross(user_daily: pd.DataFrame) -> pd.DataFrame:
+    purchases = user_daily[user_daily["n_purchase"] > 0]
 
     out = (
-        purchases.groupby("event_date", as_index=False)["amount_num"]
+        purchases.groupby("event_date", as_index=False)["purchase_amount"]
         .sum()
-        .rename(columns={"amount_num": "revenue_gross"})
+        .rename(columns={"purchase_amount": "revenue_gross"})
         .sort_values("event_date")
     )
-    return out
-
+    return _as_dates(out)
 
-def daily_revenue_net(events: pd.DataFrame) -> pd.DataFrame:
-    df = events.copy()
-    df["event_date"] = pd.to_datetime(df["event_ts_utc"]).dt.date
-    df["event_type"] = df["event_type"].astype(str).str.strip().str.lower()
 
-    df = df[df["event_type"].isin(["purchase", "refund"])].copy()
-    df["amount_num"] = pd.to_numeric(df["amount_num"], errors="coerce").fillna(0)
+def daily_revenue_net(user_daily: pd.DataFrame) -> pd.DataFrame:
+    df = user_daily[(user_daily["n_purchase"] + user_daily["n_refund"]) > 0].copy()
 
     # purchase = +amount, refund = -abs(amount)
-    df["signed_amount"] = df.apply(
-        lambda r: r["amount_num"] if r["event_type"] == "purchase" else -abs(r["amount_num"]),
-        axis=1,
-    )
+    df["signed_amount"] = df["purchase_amount"] - df["refund_amount"]
 
     out = (
         df.groupby("event_date", as_index=False)["signed_amount"]
@@ -75,24 +107,107 @@ def daily_revenue_net(events: pd.DataFrame) -> pd.DataFrame:
         .rename(columns={"signed_amount": "revenue_net"})
         .sort_values("event_date")
     )
-    return out
-
-
-def main():
+    return _as_dates(out)
+
+
+def _upsert_dates(path, df: pd.DataFrame, dates: list[str]) -> pd.DataFrame:
+    # replace only the recomputed days in an existing daily fact
+    if not path.exists():
+        return df
+    recomputed = [datetime.date.fromisoformat(d) for d in dates]
+    kept = read([path], filters=[("event_date", "not in", recomputed)])
+    return pd.concat([kept, df], ignore_index=True).sort_values("event_date")
+
+
+def daily_active_users_sql(dates: list[str] | None = None) -> pd.DataFrame:
+    sql = f"""
+    WITH {user_daily_cte(dates)}
+    SELECT event_date, COUNT(DISTINCT user_key) AS daily_active_users
+    FROM user_daily
+    WHERE n_login + n_page_view + n_purchase > 0 AND {valid_user_sql()}
+    GROUP BY event_date
+    ORDER BY event_date
+    """
+    return query_df(sql, date_cols=("event_date",))
+
+
+def daily_revenue_gross_sql(dates: list[str] | None = None) -> pd.DataFrame:
+    sql = f"""
+    WITH {user_daily_cte(dates)}
+    SELECT event_date, SUM(purchase_amount) AS revenue_gross
+    FROM user_daily
+    WHERE n_purchase > 0
+    GROUP BY event_date
+    ORDER BY event_date
+    """
+    return query_df(sql, date_cols=("event_date",))
+
+
+def daily_revenue_net_sql(dates: list[str] | None = None) -> pd.DataFrame:
+    # purchase = +amount, refund = -abs(amount)
+    sql = f"""
+    WITH {user_daily_cte(dates)}
+    SELECT event_date, SUM(purchase_amount - refund_amount) AS revenue_net
+    FROM user_daily
+    WHERE n_purchase + n_refund > 0
+    GROUP BY event_date
+    ORDER BY event_date
+    """
+    return query_df(sql, date_cols=("event_date",))
+
+
+def main(incremental: bool = False):
     GOLD_DIR.mkdir(parents=True, exist_ok=True)
 
-    events_path = SILVER_DIR / "events_clean.parquet"
-    events = pd.read_parquet(events_path)
-    logger.info(f"Read events: path={events_path} rows={len(events)}")
-
-    dau = daily_active_users(events)
-    gross = daily_revenue_gross(events)
-    net = daily_revenue_net(events)
+    dates = date_scope.event_dates(incremental)
+    if dates is not None and not dates:
+        logger.info("Gold basic metrics skipped: no event dates to recompute")
+        return
+
+    dau = user_daily = None
+    if backend_for("metrics_basic") == "duckdb":
+        logger.info(f"Computing basic metrics in DuckDB dates={'all' if dates is None else len(dates)}")
+        if hll.exact_enabled():
+            dau = daily_active_users_sql(dates)
+        gross = daily_revenue_gross_sql(dates)
+        net = daily_revenue_net_sql(dates)
+    else:
+        user_daily = silver_cache.user_daily(dates, COLUMNS, FILTERS)
+        logger.info(f"Read user_daily: rows={len(user_daily)} dates={'all' if dates is None else len(dates)}")
+
+        if hll.exact_enabled():
+            dau = daily_active_users(user_daily)
+        gross = daily_revenue_gross(user_daily)
+        net = daily_revenue_net(user_daily)
 
     dau_path = GOLD_DIR / "daily_active_users.parquet"
     gross_path = GOLD_DIR / "daily_revenue_gross.parquet"
     net_path = GOLD_DIR / "daily_revenue_net.parquet"
 
+    if hll.approx_enabled():
+        # sketches are built in pandas with one hash function, whatever the backend
+        if user_daily is None:
+            user_daily = silver_cache.user_daily(dates, COLUMNS, FILTERS)
+        sketches = daily_active_user_sketches(user_daily)
+        approx = approx_daily_active_users(sketches)
+        if dau is None:
+            dau = approx.rename(columns={"daily_active_users_approx": "daily_active_users"})
+        else:
+            dau = dau.merge(approx, on="event_date", how="left")
+
+        if dates is not None:
+            sketches = _upsert_dates(SKETCH_PATH, sketches, dates)
+        rollup = active_users_rollup(sketches)
+        sketches.to_parquet(SKETCH_PATH, index=False)
+        rollup.to_parquet(ROLLUP_PATH, index=False)
+        logger.info(f"Wrote: {SKETCH_PATH} rows={len(sketches)} precision={hll.PRECISION}")
+        logger.info(f"Wrote: {ROLLUP_PATH} rows={len(rollup)}")
+
+    if dates is not None:
+        dau = _upsert_dates(dau_path, dau, dates)
+        gross = _upsert_dates(gross_path, gross, dates)
+        net = _upsert_dates(net_path, net, dates)
+
     dau.to_parquet(dau_path, index=False)
     gross.to_parquet(gross_path, index=False)
     net.to_parquet(net_path, index=False)
@@ -1,16 +1,62 @@
+import os
+import numpy as np
 import pandas as pd
 
+from src.common import silver_cache, watermarks
 from src.common.logger import get_logger
 from src.common.paths import GOLD_DIR, SILVER_DIR
 
 logger = get_logger("gold_mrr")
 
+# per-plan / per-currency MRR come almost for free from the same sweep
+BREAKDOWNS = os.getenv("GOLD_MRR_BREAKDOWNS", "0") == "1"
+
+COLUMNS = ["start_date", "end_date", "price"] + (["plan_id", "currency"] if BREAKDOWNS else [])
+
+
+def _to_units(price: pd.Series) -> tuple[np.ndarray, int]:
+    # integer cents keep the running sum exact over long histories; fall back to float otherwise
+    cents = (price * 100).round()
+    if np.allclose(cents / 100, price, rtol=0, atol=1e-9):
+        return cents.astype("int64").to_numpy(), 100
+    return price.astype("float64").to_numpy(), 1
+
+
+def _sweep(start_idx: np.ndarray, end_idx: np.ndarray, values: np.ndarray, n_days: int,
+           key_idx: np.ndarray | None = None, n_keys: int = 1) -> np.ndarray:
+    # difference array: +value on start day, -value on the day after end, then cumsum over the grid
+    if key_idx is None:
+        key_idx = np.zeros(len(values), dtype="int64")
+    diff = np.zeros((n_days + 1, n_keys), dtype=values.dtype)
+    np.add.at(diff, (start_idx, key_idx), values)
+    np.add.at(diff, (end_idx + 1, key_idx), -values)
+    return np.cumsum(diff[:n_days], axis=0)
+
+
+def _breakdown(subs: pd.DataFrame, key: str, days, start_idx, end_idx, values, scale) -> pd.DataFrame:
+    # a missing plan/currency gets its own "Unknown" bucket; factorize would code it -1, which
+    # np.add.at reads as the last column
+    codes, keys = pd.factorize(subs[key].fillna("Unknown").astype(str), sort=True)
+    grid = _sweep(start_idx, end_idx, values, len(days), codes, len(keys)) / scale
+
+    out = pd.DataFrame(grid, columns=keys)
+    out.insert(0, "date", days)
+    return (
+        out.melt(id_vars="date", var_name=key, value_name="mrr")
+        .sort_values(["date", key])
+        .reset_index(drop=True)
+    )
+
+
+def main(incremental: bool = False):
+    if incremental and watermarks.get_pending("subscriptions") is None:
+        logger.info("Gold MRR skipped: subscriptions unchanged")
+        return
 
-def main():
     GOLD_DIR.mkdir(parents=True, exist_ok=True)
 
     subs_path = SILVER_DIR / "subscriptions_clean.parquet"
-    subs = pd.read_parquet(subs_path)
+    subs = silver_cache.subscriptions(COLUMNS)
     logger.info(f"Read subscriptions: path={subs_path} rows={len(subs)}")
 
     
@@ -25,20 +71,35 @@ def main():
     max_day = max(max_day, subs["start_date"].max())
 
     days = pd.date_range(min_day, max_day, freq="D").date
-    out_rows = []
+    n_days = len(days)
 
-    
-    for d in days:
-        active = subs[(subs["start_date"] <= d) & ((subs["end_date"].isna()) | (subs["end_date"] >= d))]
-        mrr = active["price"].sum()
-        out_rows.append({"date": d, "mrr": float(mrr)})
+    # subscriptions ending before they start are never active
+    start = pd.to_datetime(subs["start_date"])
+    end = pd.to_datetime(subs["end_date"])
+    subs = subs[end.isna() | (end >= start)]
+    start = start[subs.index]
+    end = end[subs.index]
 
-    mrr_daily = pd.DataFrame(out_rows).sort_values("date")
+    grid_start = pd.Timestamp(min_day)
+    start_idx = (start - grid_start).dt.days.to_numpy()
+    end_idx = (end - grid_start).dt.days.fillna(n_days - 1).astype("int64").to_numpy()
+
+    values, scale = _to_units(subs["price"])
+    mrr = _sweep(start_idx, end_idx, values, n_days)[:, 0] / scale
+
+    mrr_daily = pd.DataFrame({"date": days, "mrr": mrr.astype(float)}).sort_values("date")
 
     out_path = GOLD_DIR / "mrr_daily.parquet"
     mrr_daily.to_parquet(out_path, index=False)
     logger.info(f"Wrote: {out_path} rows={len(mrr_daily)}")
 
+    if BREAKDOWNS:
+        for key, file_name in [("plan_id", "mrr_daily_by_plan.parquet"), ("currency", "mrr_daily_by_currency.parquet")]:
+            out = _breakdown(subs, key, days, start_idx, end_idx, values, scale)
+            out_path = GOLD_DIR / file_name
+            out.to_parquet(out_path, index=False)
+            logger.info(f"Wrote: {out_path} rows={len(out)}")
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
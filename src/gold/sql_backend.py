@@ -0,0 +1,75 @@
+import os
+
+import duckdb
+import pandas as pd
+
+from src.common.datasets import partitioned_files
+from src.common.db import configure
+from src.common.paths import SILVER_DIR, SILVER_MARKETING_DIR, SILVER_USER_DAILY_DIR
+
+# "pandas" (reference implementation) or "duckdb"; GOLD_BACKEND_<STEP> overrides per step
+DEFAULT_BACKEND = os.getenv("GOLD_BACKEND", "pandas")
+
+# same characters str.strip() removes for the ASCII whitespace we see upstream
+_WS = "' ' || chr(9) || chr(10) || chr(11) || chr(12) || chr(13)"
+
+
+def backend_for(step: str) -> str:
+    return os.getenv(f"GOLD_BACKEND_{step.upper()}", DEFAULT_BACKEND)
+
+
+def strip_sql(col: str) -> str:
+    return f"trim(CAST({col} AS VARCHAR), {_WS})"
+
+
+def valid_user_sql(col: str = "user_key") -> str:
+    # silver gives no user_key to blank / "none" / "nan" ids
+    return f"{col} IS NOT NULL"
+
+
+def _parquet_source(files: list[str]) -> str:
+    file_list = ", ".join(f"'{f}'" for f in files)
+    # the partition key is read from the stored event_date column, not from the directory names
+    return f"read_parquet([{file_list}], union_by_name = true, hive_partitioning = false)"
+
+
+def user_daily_source(dates: list[str] | None = None) -> str:
+    if SILVER_USER_DAILY_DIR.exists():
+        if dates is None:
+            return _parquet_source([(SILVER_USER_DAILY_DIR / "*" / "*.parquet").as_posix()])
+        # partition pruning: only the requested event_date directories are listed
+        files = partitioned_files(SILVER_USER_DAILY_DIR, "event_date", dates)
+        return _parquet_source([f.as_posix() for f in files])
+
+    source = _parquet_source([(SILVER_DIR / "user_daily.parquet").as_posix()])
+    if dates is None:
+        return source
+    date_list = ", ".join(f"DATE '{d}'" for d in dates)
+    return f"(SELECT * FROM {source} WHERE CAST(event_date AS DATE) IN ({date_list}))"
+
+
+def marketing_source() -> str:
+    if SILVER_MARKETING_DIR.exists():
+        return _parquet_source([(SILVER_MARKETING_DIR / "*" / "*.parquet").as_posix()])
+    return _parquet_source([(SILVER_DIR / "marketing_spend_clean.parquet").as_posix()])
+
+
+def user_daily_cte(dates: list[str] | None = None) -> str:
+    return f"""
+    user_daily AS (
+        SELECT * REPLACE (CAST(event_date AS DATE) AS event_date)
+        FROM {user_daily_source(dates)}
+    )
+    """
+
+
+def query_df(sql: str, date_cols: tuple[str, ...] = ()) -> pd.DataFrame:
+    # in-memory connection: DuckDB scans the silver Parquet directly, no pandas copy of the events
+    con = configure(duckdb.connect())
+    try:
+        df = con.execute(sql).df()
+    finally:
+        con.close()
+    for c in date_cols:
+        df[c] = pd.to_datetime(df[c]).dt.date
+    return df
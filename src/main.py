@@ -1,7 +1,15 @@
-import time
+import os
 from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
 
+from src.common import db, inputs, run_metrics, silver_cache, user_keys, watermarks
+from src.common.dag import Step, run_dag
 from src.common.logger import get_logger, start_run
+from src.common.paths import (
+    BRONZE_DIR, EVENTS_INPUT, GOLD_DIR, MARKETING_INPUT, SILVER_DIR,
+    SILVER_EVENTS_DIR, SILVER_MARKETING_DIR, SILVER_USER_DAILY_DIR, SUBSCRIPTIONS_INPUT,
+)
 
 from src.bronze import events as bronze_events
 from src.bronze import subscriptions as bronze_subscriptions
@@ -10,6 +18,7 @@ from src.bronze import marketing as bronze_marketing
 from src.silver import events as silver_events
 from src.silver import marketing as silver_marketing
 from src.silver import subscriptions as silver_subscriptions
+from src.silver import user_daily as silver_user_daily
 
 from src.gold import metrics_basic as gold_basic
 from src.gold import mrr as gold_mrr
@@ -19,55 +28,164 @@ from src.gold import ltv as gold_ltv
 from src.gold import ltv_cac_ratio as gold_ratio
 from src.gold import load_to_duckdb as gold_load_duckdb
 from src.gold import build_dims as gold_build_dims
+from src.gold import build_views as gold_build_views
 
 logger = get_logger("main_pipeline")
 
 
-def _run_step(step_name: str, fn):
-    t0 = time.time()
+def _artifact_paths(incremental: bool) -> dict[str, list[Path]]:
+    # candidate files per DAG artifact, the first one that exists is measured
+    delta = "_delta" if incremental else ""
+    paths = {
+        "raw/events": inputs.expand(EVENTS_INPUT),
+        "raw/subscriptions": inputs.expand(SUBSCRIPTIONS_INPUT),
+        "raw/marketing": inputs.expand(MARKETING_INPUT),
+        "bronze/events": [BRONZE_DIR / f"events_raw{delta}.parquet"],
+        "bronze/subscriptions": [BRONZE_DIR / "subscriptions_raw.parquet"],
+        "bronze/marketing": [BRONZE_DIR / f"marketing_spend_raw{delta}.parquet"],
+        "silver/events": [SILVER_EVENTS_DIR, SILVER_DIR / "events_clean.parquet"],
+        "silver/marketing": [SILVER_MARKETING_DIR, SILVER_DIR / "marketing_spend_clean.parquet"],
+        "silver/subscriptions": [SILVER_DIR / "subscriptions_clean.parquet"],
+        "silver/user_keys": [user_keys.KEYS_PATH],
+        "silver/user_daily": [SILVER_USER_DAILY_DIR, SILVER_DIR / "user_daily.parquet"],
+    }
+    for _, file_name in gold_load_duckdb.GOLD_TABLES + gold_load_duckdb.OPTIONAL_TABLES:
+        paths[f"gold/{file_name.removesuffix('.parquet')}"] = [GOLD_DIR / file_name]
+    paths["gold/dau_sketches"] = [gold_basic.SKETCH_PATH]
+    return paths
+
+
+def _resolve(artifacts, artifact_paths: dict) -> list[Path]:
+    resolved = []
+    for a in artifacts:
+        existing = [p for p in artifact_paths.get(a, []) if p.exists()]
+        resolved.extend(existing[:1])
+    return resolved
+
+
+def _run_step(step_name: str, fn, inputs=(), outputs=(), artifact_paths: dict | None = None):
+    artifact_paths = artifact_paths or {}
+    meter = run_metrics.start_step(step_name, _resolve(inputs, artifact_paths))
     logger.info(f"START step={step_name}")
     try:
         fn()
-        dt = round(time.time() - t0, 3)
-        logger.info(f"END step={step_name} duration_s={dt}")
     except Exception as e:
-        dt = round(time.time() - t0, 3)
-        logger.exception(f"FAILED step={step_name} duration_s={dt} error={e}")
+        # outputs on disk are whatever a previous run left behind
+        m = run_metrics.finish_step(meter, "failed")
+        logger.exception(f"FAILED step={step_name} duration_s={m['duration_s']} error={e}")
+        # picked up by run_dag, so failed steps still show up in run_metrics
+        e.step_metrics = m
         raise
+    m = run_metrics.finish_step(meter, "success", _resolve(outputs, artifact_paths))
+    logger.info(
+        f"END step={step_name} duration_s={m['duration_s']} cpu_s={m['cpu_s']} "
+        f"peak_rss_mb={m['peak_rss_mb']} rows_in={m['rows_in']} rows_out={m['rows_out']} "
+        f"bytes_read={m['bytes_read']} bytes_written={m['bytes_written']}"
+    )
+    return m
 
 
 class MainPipeline:
+    def __init__(self, incremental: bool = False, workers: int = 1):
+        # incremental runs only process data past each source's watermark
+        self.incremental = incremental
+        # workers > 1 runs independent steps concurrently in a process pool
+        self.workers = workers
+        # one dict per finished step, written to run_metrics at the end of run_all
+        self.step_metrics = []
+        self.run_step = partial(_run_step, artifact_paths=_artifact_paths(incremental))
+
+    def bronze_steps(self) -> list[Step]:
+        inc = self.incremental
+        return [
+            Step("bronze_events", partial(bronze_events.main, incremental=inc),
+                 inputs=("raw/events",), outputs=("bronze/events",)),
+            Step("bronze_subscriptions", partial(bronze_subscriptions.main, incremental=inc),
+                 inputs=("raw/subscriptions",), outputs=("bronze/subscriptions",)),
+            Step("bronze_marketing", partial(bronze_marketing.main, incremental=inc),
+                 inputs=("raw/marketing",), outputs=("bronze/marketing",)),
+        ]
+
+    def silver_steps(self) -> list[Step]:
+        inc = self.incremental
+        return [
+            Step("silver_events", partial(silver_events.main, incremental=inc),
+                 inputs=("bronze/events",), outputs=("silver/events", "silver/user_keys")),
+            Step("silver_marketing", partial(silver_marketing.main, incremental=inc),
+                 inputs=("bronze/marketing",), outputs=("silver/marketing",)),
+            Step("silver_subscriptions", partial(silver_subscriptions.main, incremental=inc),
+                 inputs=("bronze/subscriptions",), outputs=("silver/subscriptions", "silver/user_keys")),
+            Step("silver_user_daily", partial(silver_user_daily.main, incremental=inc),
+                 inputs=("silver/events",), outputs=("silver/user_daily",)),
+        ]
+
+    def gold_steps(self) -> list[Step]:
+        inc = self.incremental
+        return [
+            Step("gold_metrics_basic", partial(gold_basic.main, incremental=inc),
+                 inputs=("silver/user_daily",),
+                 outputs=("gold/daily_active_users", "gold/daily_revenue_gross", "gold/daily_revenue_net",
+                          "gold/dau_sketches", "gold/active_users_rollup")),
+            Step("gold_mrr", partial(gold_mrr.main, incremental=inc),
+                 inputs=("silver/subscriptions",), outputs=("gold/mrr_daily",)),
+            Step("gold_cohort_retention", partial(gold_retention.main, incremental=inc),
+                 inputs=("silver/user_daily",), outputs=("gold/weekly_cohort_retention",)),
+            Step("gold_cac", gold_cac.main,
+                 inputs=("silver/user_daily", "silver/marketing"), outputs=("gold/cac_by_channel",)),
+            Step("gold_ltv", gold_ltv.main,
+                 inputs=("silver/user_daily",), outputs=("gold/ltv_per_user",)),
+            Step("gold_ltv_cac_ratio", gold_ratio.main,
+                 inputs=("gold/ltv_per_user", "silver/marketing", "silver/user_daily"), outputs=("gold/ltv_cac_ratio",)),
+            # the loader and dims only write their tables; gold_build_views publishes the whole build
+            Step("gold_load_to_duckdb", partial(gold_load_duckdb.main, incremental=inc, publish=False),
+                 inputs=tuple(f"gold/{f.removesuffix('.parquet')}"
+                              for _, f in gold_load_duckdb.GOLD_TABLES + gold_load_duckdb.OPTIONAL_TABLES),
+                 outputs=("duckdb",)),
+            Step("gold_build_dims", partial(gold_build_dims.main, publish=False),
+                 inputs=("silver/events", "silver/subscriptions", "silver/marketing", "silver/user_keys"),
+                 outputs=("duckdb",)),
+            # after the facts and dims: builds the materialized views from them and swaps all three in
+            # with one transaction and one build version
+            Step("gold_build_views", gold_build_views.main, outputs=("duckdb",)),
+        ]
+
     def run_bronze(self):
         logger.info("START stage=bronze")
-        _run_step("bronze_events", bronze_events.main)
-        _run_step("bronze_subscriptions", bronze_subscriptions.main)
-        _run_step("bronze_marketing", bronze_marketing.main)
+        run_dag(self.bronze_steps(), self.run_step, self.workers, self.step_metrics)
         logger.info("END stage=bronze")
 
     def run_silver(self):
         logger.info("START stage=silver")
-        _run_step("silver_events", silver_events.main)
-        _run_step("silver_marketing", silver_marketing.main)
-        _run_step("silver_subscriptions", silver_subscriptions.main)
+        run_dag(self.silver_steps(), self.run_step, self.workers, self.step_metrics)
         logger.info("END stage=silver")
 
     def run_gold(self):
         logger.info("START stage=gold")
-        _run_step("gold_metrics_basic", gold_basic.main)
-        _run_step("gold_mrr", gold_mrr.main)
-        _run_step("gold_cohort_retention", gold_retention.main)
-        _run_step("gold_cac", gold_cac.main)
-        _run_step("gold_ltv", gold_ltv.main)
-        _run_step("gold_ltv_cac_ratio", gold_ratio.main)
-        _run_step("gold_load_to_duckdb", gold_load_duckdb.main)
-        _run_step("gold_build_dims", gold_build_dims.main)
+        run_dag(self.gold_steps(), self.run_step, self.workers, self.step_metrics)
+        # free the shared silver frames once every gold step has used them
+        silver_cache.invalidate()
         logger.info("END stage=gold")
 
     def run_all(self):
-        logger.info("START pipeline")
-        self.run_bronze()
-        self.run_silver()
-        self.run_gold() 
+        logger.info(f"START pipeline mode={'incremental' if self.incremental else 'full'} workers={self.workers}")
+        if not self.incremental:
+            # a full rebuild replaces the watermarks with the input it reads
+            watermarks.reset_all()
+        try:
+            if self.workers <= 1:
+                self.run_bronze()
+                self.run_silver()
+                self.run_gold()
+            else:
+                # one DAG across stages, so e.g. gold_mrr starts while silver_events is still running
+                steps = self.bronze_steps() + self.silver_steps() + self.gold_steps()
+                run_dag(steps, self.run_step, self.workers, self.step_metrics)
+        finally:
+            # failed runs are recorded too, they are the ones worth comparing
+            run_metrics.write_run_metrics(self.step_metrics)
+            db.close()
+        # full runs commit too, so the next incremental run starts after the rebuilt input
+        watermarks.commit_all()
         logger.info("END pipeline")
 
 
@@ -75,7 +193,9 @@ def main():
     run_window = datetime.now(timezone.utc).strftime("%Y-%m-%d")  
     run_info = start_run(run_window=run_window, pipeline_name="lakehouse-mini-project")
     logger.info(f"RUN START {run_info}")
-    MainPipeline().run_all()
+    incremental = os.getenv("PIPELINE_MODE", "full") == "incremental"
+    workers = int(os.getenv("PIPELINE_WORKERS", "1"))
+    MainPipeline(incremental=incremental, workers=workers).run_all()
 
     logger.info(f"RUN END {run_info}")
 
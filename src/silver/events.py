@@ -1,9 +1,36 @@
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 import pandas as pd
+import pyarrow.parquet as pq
 from dateutil import parser, tz
+from src.common import event_index, silver_cache, user_keys, watermarks
+from src.common.datasets import (
+    PART_FILE, add_partition_file, concat_files, files_dataset, read_partition, write_partition,
+)
 from src.common.logger import get_logger
 logger = get_logger("silver_events")
 
-from src.common.paths import BRONZE_DIR, SILVER_DIR, QUARANTINE_DIR
+from src.common.paths import BRONZE_DIR, SILVER_DIR, SILVER_EVENTS_DIR, QUARANTINE_DIR
+
+# "vectorized" parses known formats in bulk and only falls back to dateutil for the rest
+TS_ENGINE = os.getenv("SILVER_TS_ENGINE", "vectorized")
+
+# "memory" sorts the whole batch at once; "spill" hash-partitions a full rebuild by event_id into
+# DEDUP_PARTITIONS spill files so only one partition per worker has to fit in memory
+DEDUP_MODE = os.getenv("SILVER_EVENTS_DEDUP", "memory")
+DEDUP_PARTITIONS = int(os.getenv("SILVER_EVENTS_DEDUP_PARTITIONS", "16"))
+DEDUP_WORKERS = int(os.getenv("SILVER_EVENTS_DEDUP_WORKERS", "1"))
+DEDUP_BATCH_ROWS = int(os.getenv("SILVER_EVENTS_DEDUP_BATCH_ROWS", "1000000"))
+SPILL_DIR = SILVER_DIR / "_spill_events"
+
+# rows sorted by these inside every partition file, so row-group min/max on them are selective
+STATS_SORT = ["event_type", "user_key"]
+
+_ISO_RE = r"^\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,6})?)?)?(?:Z|[+-]\d{2}:?\d{2})?$"
+_EPOCH_S_RE = r"^\d{9,10}(?:\.\d{1,6})?$"
+_EPOCH_MS_RE = r"^\d{12,13}$"
 
 
 def parse_to_utc(ts_text):
@@ -24,19 +51,116 @@ def parse_to_utc(ts_text):
         return None
 
 
-def main():
-    SILVER_DIR.mkdir(parents=True, exist_ok=True)
-    QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
+def parse_to_utc_vectorized(ts: pd.Series) -> tuple[pd.Series, dict]:
+    s = ts.astype(str).str.strip()
+    null_mask = ts.isna() | s.str.lower().isin(["", "nan", "none"])
+
+    out = pd.Series(pd.NaT, index=ts.index, dtype="datetime64[us]")
+    counts = {}
+
+    # with and without an offset parsed apart: pandas 2 gives a naive string the offset of an earlier
+    # element of the same call, pandas 3 reads it as UTC like parse_to_utc does
+    iso_mask = ~null_mask & s.str.match(_ISO_RE)
+    has_offset = s.str.contains(r"(?:Z|[+-]\d{2}:?\d{2})$")
+    counts["iso8601"] = 0
+    for mask in [iso_mask & has_offset, iso_mask & ~has_offset]:
+        parsed = pd.to_datetime(s[mask], format="ISO8601", utc=True, errors="coerce")
+        out[mask] = parsed.dt.tz_convert(None)
+        counts["iso8601"] += int(parsed.notna().sum())
+
+    for name, pattern, unit in [("epoch_s", _EPOCH_S_RE, "s"), ("epoch_ms", _EPOCH_MS_RE, "ms")]:
+        mask = ~null_mask & s.str.match(pattern)
+        parsed = pd.to_datetime(pd.to_numeric(s[mask], errors="coerce"), unit=unit, utc=True, errors="coerce")
+        out[mask] = parsed.dt.tz_convert(None)
+        counts[name] = int(parsed.notna().sum())
+
+    # whatever the bulk paths could not handle goes through dateutil one row at a time
+    rest_mask = ~null_mask & out.isna()
+    if rest_mask.any():
+        parsed = pd.to_datetime(s[rest_mask].apply(parse_to_utc), errors="coerce")
+        out[rest_mask] = parsed
+        counts["dateutil"] = int(parsed.notna().sum())
+    else:
+        counts["dateutil"] = 0
+
+    counts["null"] = int(null_mask.sum())
+    counts["unparsed"] = int(out.isna().sum()) - counts["null"]
+    return out, counts
+
+
+def _keep_latest(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.sort_values(
+        ["event_id", "event_ts_utc", "_source_line_no"],
+        ascending=[True, False, False],
+    )
+    return df.drop_duplicates(subset=["event_id"], keep="first") #event_id (string) — supposed to be unique but is not always. so I fixed it!
+
+
+def _upsert_partitions(good_df: pd.DataFrame, superseded: dict[str, set] | None = None) -> list[str]:
+    # merge the batch into the event_date partitions it touches; untouched days are never read.
+    # superseded: event_date -> event_ids whose accepted row moved to another day
+    superseded = superseded or {}
+    event_dates = good_df["event_ts_utc"].dt.strftime("%Y-%m-%d")
+    parts = dict(tuple(good_df.groupby(event_dates, sort=True)))
+    dates = sorted(set(parts) | set(superseded))
+    for event_date in dates:
+        part = parts.get(event_date, good_df.iloc[:0])
+        existing = read_partition(SILVER_EVENTS_DIR, "event_date", event_date)
+        if existing is not None:
+            existing = existing[~existing["event_id"].astype(str).isin(superseded.get(event_date, set()))]
+            part = pd.concat([existing, part], ignore_index=True)
+        write_partition(_keep_latest(part), SILVER_EVENTS_DIR, "event_date", event_date, sort_by=STATS_SORT)
+    return dates
+
+
+def _silver_parquet_source() -> str | None:
+    if not SILVER_EVENTS_DIR.exists():
+        return None
+    return f"read_parquet('{(SILVER_EVENTS_DIR / '*' / '*.parquet').as_posix()}', union_by_name = true, hive_partitioning = false)"
+
+
+def _resolve_against_index(good_df: pd.DataFrame) -> tuple[pd.DataFrame, dict[str, set], int]:
+    # last-write-wins against every event already accepted, not only the ones in this batch
+    if not event_index.exists():
+        source = _silver_parquet_source()
+        if source is not None:
+            logger.info(f"Event index rebuilt from silver: keys={event_index.rebuild(source)}")
+
+    existing = event_index.probe(good_df)
+    if existing.empty:
+        return good_df, {}, 0
+
+    ids = good_df["event_id"].astype(str)
+    prev = existing.set_index("event_id").reindex(ids.to_numpy())
+    prev.index = good_df.index
+    ts, line_no = good_df["event_ts_utc"], pd.to_numeric(good_df["_source_line_no"])
+    # ties win, so re-running the same delta after a crash rewrites the same rows
+    wins = (
+        prev["event_ts_utc"].isna()
+        | (ts > prev["event_ts_utc"])
+        | ((ts == prev["event_ts_utc"]) & (line_no >= prev["source_line_no"]))
+    )
+
+    new_dates = ts.dt.strftime("%Y-%m-%d")
+    moved = wins & prev["event_date"].notna() & (prev["event_date"] != new_dates)
+    superseded = {}
+    for event_date, event_ids in ids[moved].groupby(prev.loc[moved, "event_date"]):
+        superseded[event_date] = set(event_ids)
+    return good_df[wins], superseded, int((~wins).sum())
 
-    df = pd.read_parquet(BRONZE_DIR / "events_raw.parquet")
 
+def _clean(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, dict | None]:
     needed = ["event_id", "user_id", "event_type", "timestamp", "schema_version",
               "amount", "currency", "tax", "refers_to_event_id", "_source_line_no"]
     for c in needed:
         if c not in df.columns:
             df[c] = None
 
-    df["event_ts_utc"] = df["timestamp"].apply(parse_to_utc)
+    ts_counts = None
+    if TS_ENGINE == "dateutil":
+        df["event_ts_utc"] = df["timestamp"].apply(parse_to_utc)
+    else:
+        df["event_ts_utc"], ts_counts = parse_to_utc_vectorized(df["timestamp"])
     df["amount_num"] = pd.to_numeric(df["amount"], errors="coerce")
 
     bad_mask = (
@@ -49,14 +173,123 @@ def main():
     good_df = df[~bad_mask].copy()
 
     good_df["_source_line_no"] = pd.to_numeric(good_df["_source_line_no"], errors="coerce").fillna(0)
-    good_df = good_df.sort_values(
-        ["event_id", "event_ts_utc", "_source_line_no"],
-        ascending=[True, False, False],
-    )
-    good_df = good_df.drop_duplicates(subset=["event_id"], keep="first") #event_id (string) — supposed to be unique but is not always. so I fixed it!
+    good_df["user_key"] = user_keys.assign(good_df["user_id"])
+    return good_df, bad_df, ts_counts
+
+
+def _log_ts_counts(ts_counts: dict | None):
+    if ts_counts is not None:
+        logger.info("Timestamp parse paths: " + " ".join(f"{k}={v}" for k, v in ts_counts.items()))
+
+
+def _replace_layout():
+    # a full rebuild replaces whatever earlier runs left: partitions, the legacy single file, the index
+    shutil.rmtree(SILVER_EVENTS_DIR, ignore_errors=True)
+    (SILVER_DIR / "events_clean.parquet").unlink(missing_ok=True)
+    event_index.reset()
+
+
+def _write_date_partitions(good_df: pd.DataFrame, file_name: str = PART_FILE):
+    event_dates = good_df["event_ts_utc"].dt.strftime("%Y-%m-%d")
+    for event_date, part in good_df.groupby(event_dates, sort=True):
+        add_partition_file(part, SILVER_EVENTS_DIR, "event_date", event_date, file_name, sort_by=STATS_SORT)
+
+
+def _resolve_spill_partition(files: list[Path], k: int) -> int:
+    # every row of an event_id hashes to the same partition, so keep-latest here is global keep-latest
+    df = _keep_latest(files_dataset(files).to_table().to_pandas())
+    _write_date_partitions(df, f"part-h{k:04d}.parquet")
+    return len(df)
+
+
+def _main_spill(bronze_path: Path) -> tuple[int, int]:
+    # full rebuild with bounded memory: clean bronze in row batches, spill good rows into
+    # DEDUP_PARTITIONS files by hash(event_id), then resolve each partition on its own
+    shutil.rmtree(SPILL_DIR, ignore_errors=True)
+    spill_files = {}
+    bad_files = []
+    ts_counts = None
+    empty_good = empty_bad = None
+
+    bronze = pq.ParquetFile(bronze_path)
+    for j, batch in enumerate(bronze.iter_batches(batch_size=DEDUP_BATCH_ROWS)):
+        good_df, bad_df, counts = _clean(batch.to_pandas())
+        if counts is not None:
+            ts_counts = counts if ts_counts is None else {k: ts_counts[k] + v for k, v in counts.items()}
+        empty_good, empty_bad = good_df.iloc[:0], bad_df.iloc[:0]
+
+        if len(bad_df):
+            bad_path = SPILL_DIR / "rejected" / f"batch-{j:05d}.parquet"
+            bad_path.parent.mkdir(parents=True, exist_ok=True)
+            bad_df.to_parquet(bad_path, index=False)
+            bad_files.append(bad_path)
+
+        buckets = pd.util.hash_array(good_df["event_id"].astype(str).to_numpy(dtype=object)) % DEDUP_PARTITIONS
+        for k, part in good_df.groupby(buckets, sort=True):
+            part_path = SPILL_DIR / f"part={k:04d}" / f"batch-{j:05d}.parquet"
+            part_path.parent.mkdir(parents=True, exist_ok=True)
+            part.to_parquet(part_path, index=False)
+            spill_files.setdefault(k, []).append(part_path)
+    _log_ts_counts(ts_counts)
+
+    # each hash partition adds one file to every event_date partition it has rows for
+    keys = sorted(spill_files)
+    if DEDUP_WORKERS > 1 and len(keys) > 1:
+        with ProcessPoolExecutor(max_workers=DEDUP_WORKERS) as pool:
+            counts = list(pool.map(_resolve_spill_partition, [spill_files[k] for k in keys], keys))
+    else:
+        counts = [_resolve_spill_partition(spill_files[k], k) for k in keys]
+
+    bad_path = QUARANTINE_DIR / "events_rejected_silver.parquet"
+    if not keys and empty_good is not None:
+        empty_good.to_parquet(SILVER_DIR / "events_clean.parquet", index=False)
+    if bad_files:
+        concat_files(bad_files, bad_path)
+    elif empty_bad is not None:
+        empty_bad.to_parquet(bad_path, index=False)
+
+    n_bad = sum(pq.ParquetFile(f).metadata.num_rows for f in bad_files)
+    shutil.rmtree(SPILL_DIR, ignore_errors=True)
+    logger.info(f"Silver events dedup spill partitions: {len(keys)}")
+    return sum(counts), n_bad
+
+
+def main(incremental: bool = False):
+    SILVER_DIR.mkdir(parents=True, exist_ok=True)
+    QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
+
+    bronze_path = BRONZE_DIR / ("events_raw_delta.parquet" if incremental else "events_raw.parquet")
+
+    # incremental batches are delta-sized, only full rebuilds need the out-of-core path
+    if DEDUP_MODE == "spill" and not incremental:
+        _replace_layout()
+        n_good, n_bad = _main_spill(bronze_path)
+        silver_cache.invalidate("events")
+        logger.info(f"Silver events saved: {n_good}")
+        logger.info(f"Silver rejected saved: {n_bad}")
+        return
+
+    good_df, bad_df, ts_counts = _clean(pd.read_parquet(bronze_path))
+    _log_ts_counts(ts_counts)
+    good_df = _keep_latest(good_df)
+
+    if incremental:
+        good_df, superseded, n_stale = _resolve_against_index(good_df)
+        dates = _upsert_partitions(good_df, superseded)
+        event_index.upsert(good_df)
+        logger.info(f"Silver events older than the accepted version dropped: {n_stale}")
+        watermarks.add_dirty_dates("events", dates)
+        bad_df.to_parquet(QUARANTINE_DIR / "events_rejected_silver_delta.parquet", index=False)
+        logger.info(f"Silver events partitions updated: {len(dates)}")
+    else:
+        _replace_layout()
+        if good_df.empty:
+            # nothing to partition; readers fall back to the single file
+            good_df.to_parquet(SILVER_DIR / "events_clean.parquet", index=False)
+        _write_date_partitions(good_df)
+        bad_df.to_parquet(QUARANTINE_DIR / "events_rejected_silver.parquet", index=False)
 
-    good_df.to_parquet(SILVER_DIR / "events_clean.parquet", index=False)
-    bad_df.to_parquet(QUARANTINE_DIR / "events_rejected_silver.parquet", index=False)
+    silver_cache.invalidate("events")
 
     logger.info(f"Silver events saved: {len(good_df)}")
     logger.info(f"Silver rejected saved: {len(bad_df)}")
@@ -1,15 +1,18 @@
+import shutil
 import pandas as pd
+from src.common import silver_cache, watermarks
+from src.common.datasets import read_marketing_clean, write_partition
 from src.common.logger import get_logger
 logger = get_logger("silver_marketing")
 
-from src.common.paths import BRONZE_DIR, SILVER_DIR, QUARANTINE_DIR
+from src.common.paths import BRONZE_DIR, SILVER_DIR, SILVER_MARKETING_DIR, QUARANTINE_DIR
 
 
-def main():
+def main(incremental: bool = False):
     SILVER_DIR.mkdir(parents=True, exist_ok=True)
     QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
 
-    df = pd.read_parquet(BRONZE_DIR / "marketing_spend_raw.parquet")
+    df = pd.read_parquet(BRONZE_DIR / ("marketing_spend_raw_delta.parquet" if incremental else "marketing_spend_raw.parquet"))
 
 
     df["date"] = pd.to_datetime(df["date"], errors="coerce")
@@ -28,11 +31,23 @@ def main():
         .rename(columns={"spend_num": "spend"})
     )
 
+    if incremental and daily.empty:
+        bad_df.to_parquet(QUARANTINE_DIR / "marketing_spend_rejected_silver_delta.parquet", index=False)
+        logger.info(f"Silver marketing no new days, rejected: {len(bad_df)}")
+        return
+
     # fill missing days with 0 for each channel
     channels = sorted(daily["channel"].unique().tolist())
     min_day = daily["date"].min()
     max_day = daily["date"].max()
 
+    wm = watermarks.get_watermark("marketing") if incremental else None
+    if incremental and SILVER_MARKETING_DIR.exists():
+        # keep the grid continuous with the days already published
+        channels = sorted(set(channels) | set(read_marketing_clean(["channel"])["channel"].unique().tolist()))
+    if wm is not None:
+        min_day = min(min_day, pd.Timestamp(wm["max_date"]))
+
     all_days = pd.date_range(min_day, max_day, freq="D")
     grid = pd.MultiIndex.from_product([all_days, channels], names=["date", "channel"]).to_frame(index=False)
 
@@ -40,8 +55,19 @@ def main():
     daily_full["spend"] = daily_full["spend"].fillna(0.0)
 
     # write
-    daily_full.to_parquet(SILVER_DIR / "marketing_spend_clean.parquet", index=False)
-    bad_df.to_parquet(QUARANTINE_DIR / "marketing_spend_rejected_silver.parquet", index=False)
+    if not incremental:
+        # a full rebuild replaces whatever layout earlier runs left
+        shutil.rmtree(SILVER_MARKETING_DIR, ignore_errors=True)
+        (SILVER_DIR / "marketing_spend_clean.parquet").unlink(missing_ok=True)
+        if daily_full.empty:
+            # nothing to partition; readers fall back to the single file
+            daily_full.to_parquet(SILVER_DIR / "marketing_spend_clean.parquet", index=False)
+    for day, part in daily_full.groupby(daily_full["date"].dt.strftime("%Y-%m-%d"), sort=True):
+        write_partition(part, SILVER_MARKETING_DIR, "date", day, sort_by=["channel"])
+    suffix = "_delta" if incremental else ""
+    bad_df.to_parquet(QUARANTINE_DIR / f"marketing_spend_rejected_silver{suffix}.parquet", index=False)
+
+    silver_cache.invalidate("marketing")
 
     logger.info(f"Silver marketing saved: {len(daily_full)}")
     logger.info(f"Silver marketing rejected: {len(bad_df)}")
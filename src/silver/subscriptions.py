@@ -1,5 +1,6 @@
 import pandas as pd
 
+from src.common import silver_cache, user_keys, watermarks
 from src.common.logger import get_logger
 from src.common.paths import BRONZE_DIR, SILVER_DIR, QUARANTINE_DIR
 
@@ -13,7 +14,27 @@ def _ensure_cols(df: pd.DataFrame, cols: list[str]) -> pd.DataFrame:
     return df
 
 
-def main():
+def _classify_intervals(df: pd.DataFrame) -> pd.DataFrame:
+    # one sorted pass: each subscription is compared with the latest end of every earlier one of
+    # the same user (running max), not just the previous row, so a long-running plan is not skipped
+    df = df.sort_values(["user_id", "start_dt", "created_at_ts"], ascending=[True, True, False])
+    df["end_eff"] = df["end_dt"].fillna(pd.Timestamp("2100-01-01"))
+
+    first_of_user = df["user_id"].ne(df["user_id"].shift())
+    covered_until = df.groupby("user_id", sort=False)["end_eff"].cummax()
+    df["prev_end_eff"] = covered_until.shift().mask(first_of_user)
+
+    df["is_overlap"] = df["prev_end_eff"].notna() & (df["start_dt"] <= df["prev_end_eff"])
+    df["gap_days"] = (df["start_dt"] - df["prev_end_eff"]).dt.days - 1
+    df["reactivated"] = df["gap_days"].fillna(0).gt(0)
+    return df
+
+
+def main(incremental: bool = False):
+    if incremental and watermarks.get_pending("subscriptions") is None:
+        logger.info("Silver subscriptions skipped: no new subscriptions")
+        return
+
     SILVER_DIR.mkdir(parents=True, exist_ok=True)
     QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -45,24 +66,18 @@ def main():
         df["created_at_ts"].isna()
     )
 
-    bad_df = df.loc[bad_mask].copy()
-    good_df = df.loc[~bad_mask].copy()
+    bad_df = df.loc[bad_mask]
+    good_df = df.loc[~bad_mask]
 
     good_df = good_df.sort_values(["subscription_id", "created_at_ts"], ascending=[True, False])
     good_df = good_df.drop_duplicates(subset=["subscription_id"], keep="first")
 
-    tmp = good_df.copy()
-    tmp["end_eff"] = tmp["end_dt"].fillna(pd.Timestamp("2100-01-01"))
-    tmp = tmp.sort_values(["user_id", "start_dt", "created_at_ts"], ascending=[True, True, False])
-
-    tmp["prev_end_eff"] = tmp.groupby("user_id")["end_eff"].shift(1)
-    tmp["is_overlap"] = tmp["prev_end_eff"].notna() & (tmp["start_dt"] <= tmp["prev_end_eff"])
+    good_df = _classify_intervals(good_df)
 
-    tmp["gap_days"] = (tmp["start_dt"] - tmp["prev_end_eff"]).dt.days - 1
-    tmp["reactivated"] = tmp["gap_days"].fillna(0).gt(0)
+    overlap_df = good_df.loc[good_df["is_overlap"]]
+    good_df = good_df.loc[~good_df["is_overlap"]]
 
-    overlap_df = tmp.loc[tmp["is_overlap"]].copy()
-    good_df = tmp.loc[~tmp["is_overlap"]].copy()
+    good_df["user_key"] = user_keys.assign(good_df["user_id"])
 
     overlap_count = len(overlap_df)
     reactivation_count = int(good_df["reactivated"].sum())
@@ -72,8 +87,8 @@ def main():
         "status", "created_at", "created_at_ts",
         "start_dt", "end_dt", "gap_days", "reactivated"
     ]
-    overlap_df = _ensure_cols(overlap_df, keep_cols)[keep_cols].copy()
-    good_df = _ensure_cols(good_df, keep_cols)[keep_cols].copy()
+    overlap_df = overlap_df[keep_cols]
+    good_df = good_df[keep_cols + ["user_key"]]
 
     good_df = good_df.rename(columns={"start_dt": "start_date", "end_dt": "end_date"})
     overlap_df = overlap_df.rename(columns={"start_dt": "start_date", "end_dt": "end_date"})
@@ -83,16 +98,22 @@ def main():
         "start_date", "end_date", "status", "created_at", "created_at_ts",
         "gap_days", "reactivated"
     ]
-    bad_df = _ensure_cols(bad_df, bad_keep).copy()
+    bad_df = _ensure_cols(bad_df, bad_keep)
     bad_df["gap_days"] = pd.NA
     bad_df["reactivated"] = pd.NA
-    bad_df = bad_df[bad_keep].copy()
+    bad_df = bad_df[bad_keep]
+
+    # quarantine keeps dates as text: invalid rows may have nothing parseable to convert
+    for c in ["start_date", "end_date"]:
+        overlap_df[c] = overlap_df[c].dt.strftime("%Y-%m-%d")
 
     bad_df = pd.concat([bad_df, overlap_df[bad_keep]], ignore_index=True)
 
     good_df.to_parquet(SILVER_DIR / "subscriptions_clean.parquet", index=False)
     bad_df.to_parquet(QUARANTINE_DIR / "subscriptions_rejected_silver.parquet", index=False)
 
+    silver_cache.invalidate("subscriptions")
+
     logger.info(f"Silver subscriptions overlaps quarantined: {overlap_count}")
     logger.info(f"Silver subscriptions reactivations flagged: {reactivation_count}")
     logger.info(f"Silver subscriptions saved: {len(good_df)}")
@@ -0,0 +1,92 @@
+import shutil
+
+import pandas as pd
+
+from src.common import silver_cache, watermarks
+from src.common.datasets import list_partitions, partition_dir, read_events_clean, read_partition, write_partition
+from src.common.kpi_math import signed_amount
+from src.common.logger import get_logger
+from src.common.paths import SILVER_DIR, SILVER_EVENTS_DIR, SILVER_USER_DAILY_DIR
+
+logger = get_logger("silver_user_daily")
+
+# one n_<type> count column each; other types only add to n_events
+EVENT_TYPES = ["signup", "login", "page_view", "purchase", "refund", "trial_start", "trial_convert"]
+
+KEYS = ["event_date", "user_key"]
+
+# the event columns the rollup reads
+COLUMNS = ["event_ts_utc", "user_key", "event_type", "amount_num", "acquisition_channel"]
+
+
+def rollup(events: pd.DataFrame) -> pd.DataFrame:
+    # one row per (event_date, user_key); events without a user key land in the <NA> row, which
+    # only the per-date revenue facts read
+    df = events
+    df["event_date"] = df["event_ts_utc"].dt.normalize()
+
+    counts = (
+        df.groupby(KEYS + ["event_type"], dropna=False, observed=True).size()
+        .unstack("event_type", fill_value=0)
+    )
+    out = counts.reindex(columns=EVENT_TYPES, fill_value=0).add_prefix("n_")
+    out["n_events"] = counts.sum(axis=1)
+
+    # kept apart so gross and net both follow; refund_amount holds the refunded magnitude
+    amount = pd.to_numeric(df["amount_num"], errors="coerce").fillna(0)
+    signed = signed_amount(df["event_type"], amount)
+    df["purchase_amount"] = signed.where(df["event_type"] == "purchase", 0.0)
+    df["refund_amount"] = (-signed).where(df["event_type"] == "refund", 0.0)
+    out = out.join(df.groupby(KEYS, dropna=False)[["purchase_amount", "refund_amount"]].sum())
+
+    # the user's first signup of the day, and the first signup of the day that named a channel
+    signups = df[df["event_type"] == "signup"].sort_values("event_ts_utc", kind="stable")
+    out = out.join(signups.groupby(KEYS)["event_ts_utc"].min().rename("first_signup_ts"))
+    channels = signups.assign(signup_channel=signups["acquisition_channel"].astype(str).str.strip())
+    channels = channels.dropna(subset=["signup_channel"]).drop_duplicates(KEYS)
+    out = out.join(
+        channels.set_index(KEYS)[["signup_channel", "event_ts_utc"]].rename(columns={"event_ts_utc": "signup_channel_ts"})
+    )
+    return out.reset_index()
+
+
+def _replace_layout():
+    shutil.rmtree(SILVER_USER_DAILY_DIR, ignore_errors=True)
+    (SILVER_DIR / "user_daily.parquet").unlink(missing_ok=True)
+
+
+def main(incremental: bool = False):
+    if incremental:
+        # each partition only depends on the same day's events, so the dirty days are enough
+        dates = watermarks.get_dirty_dates("events")
+        if not dates:
+            logger.info("Silver user_daily skipped: no new event dates")
+            return
+    else:
+        _replace_layout()
+        if not SILVER_EVENTS_DIR.exists():
+            out = rollup(silver_cache.normalize_events(read_events_clean(columns=COLUMNS)))
+            out.to_parquet(SILVER_DIR / "user_daily.parquet", index=False)
+            silver_cache.invalidate("user_daily")
+            logger.info(f"Silver user_daily saved: {len(out)}")
+            return
+        dates = list_partitions(SILVER_EVENTS_DIR, "event_date")
+
+    # one day at a time, so memory is bounded by the largest day of events
+    n_rows = n_events = 0
+    for event_date in dates:
+        events = read_partition(SILVER_EVENTS_DIR, "event_date", event_date, COLUMNS)
+        if events is None:
+            shutil.rmtree(partition_dir(SILVER_USER_DAILY_DIR, "event_date", event_date), ignore_errors=True)
+            continue
+        out = rollup(silver_cache.normalize_events(events))
+        write_partition(out, SILVER_USER_DAILY_DIR, "event_date", event_date, sort_by=["user_key"])
+        n_rows += len(out)
+        n_events += len(events)
+
+    silver_cache.invalidate("user_daily")
+    logger.info(f"Silver user_daily saved: {n_rows} from events={n_events} partitions={len(dates)}")
+
+
+if __name__ == "__main__":
+    main()